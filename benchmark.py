@@ -0,0 +1,331 @@
+
+import contextlib, io, json, os, platform, random, sys, tempfile, time, uuid
+from typing import *
+
+from wardrobe import Article, FixedData, JsonStorage, SegmentedStorage, SqliteStorage, Wardrobe, WardrobeGenerator
+
+SIZES = (100, 1000, 10000)      # synthetic wardrobe sizes, in articles, '--sizes 100,1000'
+REPEAT = 5                      # runs per measurement, the fastest one is reported
+HISTORY_RATIO = 10              # one synthetic outfit in the history per this many articles
+IMPORT_LINES = 1000             # lines imported into each wardrobe
+THRESHOLD = 0.25                # slowdown over the baseline that counts as a regression, '--threshold 0.25'
+MIN_DELTA = 0.002               # seconds a measurement must also slow down by, sub-millisecond cases are mostly noise, '--min-delta 0.002'
+
+FIXTURES = {}   # size -> (json text, history lines), shared by the benchmarks of one run
+
+
+def synthetic_articles(fixed: FixedData, article_type: str, count: int, rng: random.Random) -> Tuple[Article, ...]:
+    subtypes = fixed.article_map[article_type]
+    colors = sorted(fixed.color_ids)
+
+    return tuple( Article(uuid.UUID(int=rng.getrandbits(128)), article_type, rng.choice(subtypes), "synthetic {0}".format(i), [rng.choice(colors)], 'any', 0) for i in range(count) )
+
+
+def synthetic_wardrobe(fixed: FixedData, size: int, rng: random.Random) -> Dict[str, List[Dict]]:
+    # articles spread evenly over fixed.json's types, with one or two colors from its compatibility table
+    article_types = list(fixed.article_map.keys())
+    colors = sorted(fixed.compatibility.keys())
+    data = { article_type:[] for article_type in article_types }
+
+    for i in range(size):
+        article_type = article_types[i % len(article_types)]
+        article = Article(uuid.UUID(int=rng.getrandbits(128)), article_type, rng.choice(fixed.article_map[article_type]), "synthetic {0}".format(i),
+                          rng.sample(colors, rng.randint(1, 2)), rng.choice(fixed.weather), rng.randint(0, 200))
+        data[article_type].append(article.jsonify())
+
+    return data
+
+
+def synthetic_import_lines(fixed: FixedData, count: int, rng: random.Random) -> List[str]:
+    # in the import file format, none of them duplicates an article of the wardrobe
+    article_types = list(fixed.article_map.keys())
+    colors = sorted(fixed.compatibility.keys())
+
+    return [ '{0} {1} "imported {2}" {3} {4} {5}$\n'.format(article_types[i % len(article_types)], rng.choice(fixed.article_map[article_types[i % len(article_types)]]),
+                                                            i, rng.choice(colors), rng.choice(fixed.weather), rng.randint(0, 200)) for i in range(count) ]
+
+
+def fixture(fixed: FixedData, size: int) -> Tuple[str, List[str]]:
+    # a wardrobe file and its history file for `size` articles, the same for every run
+    if size not in FIXTURES:
+        data = synthetic_wardrobe(fixed, size, random.Random(size))
+
+        generator = WardrobeGenerator.from_loaded(fixed, Wardrobe(fixed.article_map, json.loads(json.dumps(data))))
+        outfits = generator.generate_many({}, max(1, size // HISTORY_RATIO), False, size)
+        history = [ json.dumps(outfit.dump(generator.wardrobe.articles_by_oid))+'\n' for outfit in outfits ]
+
+        FIXTURES[size] = (json.dumps(data), history)
+
+    return FIXTURES[size]
+
+
+def fixture_files(fixed: FixedData, size: int, directory: str) -> str:
+    # writes the fixture to '<directory>/wardrobe.json' and its history file, returns the wardrobe's path
+    text, history = fixture(fixed, size)
+    filepath = os.path.join(directory, 'wardrobe.json')
+
+    with open(filepath, 'w') as wardrobe_file:
+        wardrobe_file.write(text)
+    with open("{0}.history".format(filepath), 'w') as history_file:
+        history_file.write(''.join(history))
+
+    return filepath
+
+
+def fixture_generator(fixed: FixedData, size: int) -> WardrobeGenerator:
+    return WardrobeGenerator.from_loaded(fixed, Wardrobe(fixed.article_map, json.loads(fixture(fixed, size)[0])))
+
+
+def best_of(function: Callable, setup: Callable =None, repeat: int =REPEAT) -> float:
+    # the fastest of several runs is the one least disturbed by the rest of the machine.
+    # setup runs untimed before each run, its result is passed to the function
+    timings = []
+    for i in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        if setup:
+            function(argument)
+        else:
+            function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def record(results: Dict[str, Dict[str, float]], case: str, size: int, seconds: float):
+    results.setdefault(case, {})[str(size)] = seconds
+    print("{0:>24} | {1:>10} | {2:>12.3f}".format(case, size, seconds * 1e3))
+
+
+def print_header():
+    print("{0:>24} | {1:>10} | {2:>12}".format("case", "size", "ms"))
+
+
+def bench_accessory_selection(sizes=(10, 100, 1000, 10000, 100000), draws=2000):
+    # accessory selection should cost O(k) in the number of accessories picked, independent of the pool size
+    fixed = FixedData.load('fixed.json')
+    generator = WardrobeGenerator.from_loaded(fixed, Wardrobe(fixed.article_map, {}))
+    rng = random.Random(0)
+    results = {}
+
+    print("{0:>10} | {1:>12}".format("pool size", "us per draw"))
+
+    timings = []
+    for size in sizes:
+        pools = { 'accessory':synthetic_articles(fixed, 'accessory', size, rng) }
+
+        start = time.perf_counter()
+        for i in range(draws):
+            generator.draw_outfit(pools, rng)
+        per_draw = (time.perf_counter() - start) / draws
+
+        timings.append(per_draw)
+        results.setdefault('accessory.draw', {})[str(size)] = per_draw
+        print("{0:>10} | {1:>12.2f}".format(size, per_draw * 1e6))
+
+    print("largest/smallest pool: {0:.2f}x".format(timings[-1] / timings[0]))
+
+    return results
+
+
+def bench_load(sizes=SIZES):
+    # opening a wardrobe from its files, and parsing its history (which is deferred until it is read)
+    fixed = FixedData.load('fixed.json')
+    results = {}
+    print_header()
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = fixture_files(fixed, size, directory)
+            record(results, 'load.json', size, best_of(lambda: JsonStorage(filepath).open(fixed.article_map)))
+            record(results, 'history.all', size, best_of(lambda wardrobe: wardrobe.outfit_history.load(), lambda: JsonStorage(filepath).open(fixed.article_map)))
+            record(results, 'history.last', size, best_of(lambda wardrobe: wardrobe.outfit_history.last(10), lambda: JsonStorage(filepath).open(fixed.article_map)))
+
+            database = os.path.join(directory, 'wardrobe.db')
+            storage = SqliteStorage(database)
+            storage.export(JsonStorage(filepath).open(fixed.article_map))
+            storage.connection.close()
+            record(results, 'load.sqlite', size, best_of(lambda: SqliteStorage(database).open(fixed.article_map)))
+            record(results, 'query.sqlite', size, best_of(lambda: SqliteStorage(database).load('pants')))
+
+    return results
+
+
+def bench_filters(sizes=SIZES):
+    # each index query on its own, then the whole filter chain generation runs
+    fixed = FixedData.load('fixed.json')
+    results = {}
+    print_header()
+
+    palette = sorted(fixed.palettes.keys())[0]
+    use = sorted(fixed.uses.keys())[0]
+
+    for size in sizes:
+        generator = fixture_generator(fixed, size)
+        wardrobe = generator.wardrobe
+
+        def reset_index():
+            wardrobe.index = None
+
+        record(results, 'filter.index', size, best_of(lambda argument: wardrobe.attribute_index(), reset_index))
+        record(results, 'filter.type', size, best_of(lambda: wardrobe.select('pants')))
+        record(results, 'filter.subtype', size, best_of(lambda: wardrobe.select('pants', [fixed.article_map['pants'][0]])))
+        record(results, 'filter.color', size, best_of(lambda: wardrobe.select('pants', colors=['black', 'blue'])))
+        record(results, 'filter.weather', size, best_of(lambda: wardrobe.select('pants', weather='cold')))
+        record(results, 'filter.pools', size, best_of(lambda: generator.candidate_pools({ 'weather':'cold', 'color':palette, 'use':use })))
+
+    return results
+
+
+def bench_generation(sizes=SIZES):
+    fixed = FixedData.load('fixed.json')
+    results = {}
+    print_header()
+
+    for size in sizes:
+        generator = fixture_generator(fixed, size)
+        generator.candidate_pools({})   # builds the lazy indexes outside the measurement
+
+        record(results, 'generate.single', size, best_of(lambda: generator.generate_by_criteria({ 'weather':'cold' }, seed=1)))
+        record(results, 'generate.batch', size, best_of(lambda: generator.generate_many({ 'weather':'cold' }, 7, True, 1)))
+        record(results, 'generate.compatible', size, best_of(lambda: generator.generate_many({ 'weather':'cold', 'engine':'compatible' }, 3, True, 1)))
+
+        # recency weights come from the wear index, built from the fixture's history outside the measurement
+        for outfit in generator.generate_many({}, max(1, size // HISTORY_RATIO), False, size):
+            generator.wardrobe.add_outfit(outfit)
+        generator.wardrobe.outfit_history.wear_index()
+
+        record(results, 'generate.fresh', size, best_of(lambda: generator.generate_many({ 'weather':'cold', 'engine':'fresh' }, 7, True, 1)))
+
+    return results
+
+
+def bench_import(sizes=SIZES):
+    # IMPORT_LINES new articles into a wardrobe of each size, committed to its journal
+    fixed = FixedData.load('fixed.json')
+    results = {}
+    print_header()
+
+    lines = synthetic_import_lines(fixed, IMPORT_LINES, random.Random(0))
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            def open_copy():
+                filepath = fixture_files(fixed, size, directory)
+                # the journal of the previous run would be replayed
+                if os.path.exists("{0}.journal".format(filepath)):
+                    os.remove("{0}.journal".format(filepath))
+                return WardrobeGenerator.from_file(fixed, filepath)
+
+            def run(generator):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    generator.import_articles(lines)
+
+            record(results, 'import', size, best_of(run, open_copy))
+
+    return results
+
+
+def bench_save(sizes=SIZES):
+    # a full snapshot of the wardrobe in each storage backend, an indented export, and snapshots after a single edit
+    fixed = FixedData.load('fixed.json')
+    results = {}
+    print_header()
+
+    for size in sizes:
+        generator = fixture_generator(fixed, size)
+
+        with tempfile.TemporaryDirectory() as directory:
+            json_storage = JsonStorage(os.path.join(directory, 'wardrobe.json'))
+            # every type serialized again, as in the first save of a process
+            record(results, 'save.json', size, best_of(lambda argument: json_storage.save(generator.wardrobe), json_storage.segments.clear))
+            record(results, 'export.json.pretty', size, best_of(lambda: json_storage.export(generator.wardrobe, True)))
+
+            sqlite_storage = SqliteStorage(os.path.join(directory, 'wardrobe.db'))
+            record(results, 'save.sqlite', size, best_of(lambda: sqlite_storage.export(generator.wardrobe)))
+            sqlite_storage.connection.close()
+
+            segmented_storage = SegmentedStorage(os.path.join(directory, 'wardrobe.d'))
+            segmented_storage.save(generator.wardrobe)
+
+            def edit():
+                generator.wardrobe.add_article(Article(None, 'pants', fixed.article_map['pants'][0], "edit", ['black'], 'any', 0))
+
+            record(results, 'save.json.edit', size, best_of(lambda argument: json_storage.save(generator.wardrobe), edit))
+            record(results, 'save.segmented.edit', size, best_of(lambda argument: segmented_storage.save(generator.wardrobe), edit))
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float =THRESHOLD, min_delta: float =MIN_DELTA) -> List[Tuple[str, str, float]]:
+    # (case, size, slowdown) of every measurement slower than its baseline by more than the threshold and by at least min_delta seconds
+    regressions = []
+
+    print("{0:>24} | {1:>10} | {2:>12} | {3:>12} | {4:>8}".format("case", "size", "baseline ms", "ms", "change"))
+    for case, timings in results.items():
+        for size, seconds in timings.items():
+            if size not in baseline.get(case, {}):
+                continue
+
+            change = seconds / baseline[case][size] - 1
+            regressed = change > threshold and seconds - baseline[case][size] >= min_delta
+            print("{0:>24} | {1:>10} | {2:>12.3f} | {3:>12.3f} | {4:>+7.0%}{5}".format(case, size, baseline[case][size] * 1e3, seconds * 1e3, change, " <-" if regressed else ""))
+
+            if regressed:
+                regressions.append((case, size, change))
+
+    return regressions
+
+
+benchmarks = {
+    'accessory':bench_accessory_selection,
+    'load':bench_load,
+    'filter':bench_filters,
+    'generate':bench_generation,
+    'import':bench_import,
+    'save':bench_save
+}
+
+
+usage = "python benchmark.py [{0}] ... [--sizes 100,1000] [--json results.json] [--baseline results.json] [--threshold 0.25] [--min-delta 0.002]".format('|'.join(benchmarks.keys()))
+
+
+if __name__ == '__main__':
+    options = {}
+    for option in ('--sizes', '--json', '--baseline', '--threshold', '--min-delta'):
+        if option in sys.argv[:-1]:
+            position = sys.argv.index(option)
+            options[option] = sys.argv[position + 1]
+            del sys.argv[position:position + 2]
+
+    if '--help' in sys.argv or '-h' in sys.argv:
+        print(usage)
+        sys.exit(0)
+
+    unknown = [ name for name in sys.argv[1:] if name not in benchmarks ]
+    if unknown:
+        print("Unknown benchmark {0}\n{1}".format(', '.join(unknown), usage))
+        sys.exit(2)
+
+    selected = sys.argv[1:] or list(benchmarks.keys())
+    sizes = tuple( int(size) for size in options['--sizes'].split(',') ) if '--sizes' in options else None
+
+    results = {}
+    for name in selected:
+        print("### {0} ###".format(name))
+        results.update(benchmarks[name](sizes) if sizes else benchmarks[name]())
+
+    if '--json' in options:
+        with open(options['--json'], 'w') as results_file:
+            json.dump({ 'python':platform.python_version(), 'platform':platform.platform(), 'results':results }, results_file, indent=4)
+
+    if '--baseline' in options:
+        with open(options['--baseline']) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        print("### baseline {0} ###".format(options['--baseline']))
+        regressions = compare(results, baseline, float(options.get('--threshold', THRESHOLD)), float(options.get('--min-delta', MIN_DELTA)))
+
+        if regressions:
+            print("{0} regressions over {1:.0%} and {2:.1f}ms".format(len(regressions), float(options.get('--threshold', THRESHOLD)), float(options.get('--min-delta', MIN_DELTA)) * 1e3))
+            sys.exit(1)
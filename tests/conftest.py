@@ -0,0 +1,43 @@
+import json, os, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from wardrobe import FixedData
+
+
+@pytest.fixture(scope='session')
+def fixed():
+    return FixedData.load(os.path.join(ROOT, 'fixed.json'))
+
+
+@pytest.fixture
+def articles(fixed):
+    # article json, a few articles of every type with fixed oids so tests can refer to them
+    per_type = 3
+    colors = ['black', 'grey', 'blue', 'white', 'brown']
+    data = {}
+
+    for type_index, (article_type, subtypes) in enumerate(fixed.article_map.items()):
+        data[article_type] = [ {
+            'oid': "00000000-0000-0000-0000-{0:06d}{1:06d}".format(type_index, i),
+            'article_type': article_type,
+            'article_subtype': subtypes[i % len(subtypes)],
+            'description': "{0} {1}".format(article_type, i),
+            'weather': ['any', 'cold', 'hot'][i % 3],
+            'price': i * 10,
+            'colors': [colors[(type_index + i) % len(colors)]]
+        } for i in range(per_type) ]
+
+    return data
+
+
+@pytest.fixture
+def wardrobe_file(articles, tmp_path):
+    # a json wardrobe of the sample articles, without history
+    filepath = str(tmp_path / 'wardrobe.json')
+    with open(filepath, 'w') as wardrobe_data:
+        json.dump(articles, wardrobe_data)
+    return filepath
@@ -0,0 +1,140 @@
+import asyncio
+
+from wardrobe import WardrobeGenerator
+from wardrobe_api import LocalClient, WardrobeAPI
+
+
+def run(fixed, filepath, test):
+    # runs test(client, api) against an API over the wardrobe at filepath, on its own event loop
+    async def session():
+        api = WardrobeAPI(WardrobeGenerator.from_file(fixed, filepath))
+        try:
+            return await test(LocalClient(api), api)
+        finally:
+            await api.close()
+
+    return asyncio.run(session())
+
+
+def article_oids(outfit):
+    return sorted( article['oid'] for articles in outfit['articles'].values() for article in articles )
+
+
+def test_generate_with_seed(fixed, wardrobe_file):
+    async def test(client, api):
+        first = await client.get('/generate?weather=cold&seed=7')
+        second = await client.get('/generate?weather=cold&seed=7')
+        history = await client.get('/history')
+        return first, second, history
+
+    (status, first), (second_status, second), (history_status, history) = run(fixed, wardrobe_file, test)
+
+    assert status == second_status == history_status == 200
+    assert len(first['outfits']) == 1
+    assert first['outfits'][0]['seed'] == second['outfits'][0]['seed'] == 7
+    assert article_oids(first['outfits'][0]) == article_oids(second['outfits'][0])
+    assert [ outfit['oid'] for outfit in history['outfits'] ] == [ first['outfits'][0]['oid'], second['outfits'][0]['oid'] ]
+
+    # the same outfit as 'generate weather:cold seed:7' from the CLI
+    cli = WardrobeGenerator.from_file(fixed, wardrobe_file).generate_by_criteria({ 'weather':'cold' }, seed=7)
+    assert article_oids(first['outfits'][0]) == sorted( str(article.oid) for articles in cli.values() for article in articles )
+
+
+def test_add_and_delete_article(fixed, wardrobe_file):
+    article = { 'article_type':'pants', 'article_subtype':'jeans', 'description':'added', 'weather':'any', 'price':40, 'colors':['blue'] }
+
+    async def test(client, api):
+        added = await client.post('/articles', article)
+        listed = await client.get('/list?type=pants')
+        deleted = await client.delete('/articles/{0}'.format(added[1]['article']['oid']))
+        relisted = await client.get('/list?type=pants')
+        return added, listed, deleted, relisted
+
+    (added_status, added), (_, listed), (deleted_status, deleted), (_, relisted) = run(fixed, wardrobe_file, test)
+    oid = added['article']['oid']
+
+    assert added_status == 201
+    assert oid in [ listed_article['oid'] for listed_article in listed['articles'] ]
+    assert deleted_status == 200 and deleted['article']['oid'] == oid
+    assert oid not in [ listed_article['oid'] for listed_article in relisted['articles'] ]
+
+    # both writes were committed
+    assert oid not in WardrobeGenerator.from_file(fixed, wardrobe_file).wardrobe.articles_by_oid
+
+
+def test_delete_missing_article(fixed, wardrobe_file):
+    async def test(client, api):
+        return await client.delete('/articles/00000000-0000-0000-0000-999999999999')
+
+    status, response = run(fixed, wardrobe_file, test)
+
+    assert status == 404
+    assert 'error' in response
+
+
+def test_bad_input(fixed, wardrobe_file):
+    requests = [
+        ('POST', '/articles', { 'article_type':'pants', 'article_subtype':'skirt' }),
+        ('POST', '/articles', ['not', 'an', 'article']),
+        ('GET', '/generate?color=no-such-palette', None),
+        ('GET', '/generate?accessory_count=abc', None),
+        ('GET', '/generate?count=x', None),
+        ('GET', '/generate?count=100000000', None),
+        ('GET', '/generate?engine=compatible&top=100000000', None),
+        ('GET', '/history?last=x', None)
+    ]
+
+    async def test(client, api):
+        return [ await client.request(method, target, payload) for method, target, payload in requests ]
+
+    responses = run(fixed, wardrobe_file, test)
+
+    for (method, target, payload), (status, response) in zip(requests, responses):
+        assert status == 400, target
+        assert 'error' in response
+
+    status, response = run(fixed, wardrobe_file, lambda client, api: client.get('/nowhere'))
+    assert status == 404
+
+
+def test_history_last(fixed, wardrobe_file):
+    async def test(client, api):
+        generated = await client.get('/generate?count=3&seed=1')
+        last = await client.get('/history?last=2')
+        return generated, last
+
+    (status, generated), (last_status, last) = run(fixed, wardrobe_file, test)
+
+    assert status == last_status == 200
+    assert len(generated['outfits']) == 3
+    assert [ outfit['oid'] for outfit in last['outfits'] ] == [ outfit['oid'] for outfit in generated['outfits'][1:] ]
+    assert [ article_oids(outfit) for outfit in last['outfits'] ] == [ article_oids(outfit) for outfit in generated['outfits'][1:] ]
+
+
+def test_failed_commit_is_not_persisted_later(fixed, wardrobe_file):
+    failed = { 'article_type':'pants', 'article_subtype':'jeans', 'description':'failed', 'weather':'any', 'price':0, 'colors':['blue'] }
+    committed = dict(failed, description='committed')
+
+    async def test(client, api):
+        storage = api.generator.storage
+        commit = storage.commit
+
+        def failing_commit(wardrobe, compact=True):
+            storage.commit = commit
+            raise OSError("disk full")
+
+        storage.commit = failing_commit
+        first = await client.post('/articles', failed)
+        listed = await client.get('/list?type=pants')
+        second = await client.post('/articles', committed)
+        return first, listed, second
+
+    (first_status, first), (_, listed), (second_status, second) = run(fixed, wardrobe_file, test)
+
+    assert first_status == 500
+    assert 'failed' not in [ article['description'] for article in listed['articles'] ]
+    assert second_status == 201
+
+    descriptions = [ article.description for article in WardrobeGenerator.from_file(fixed, wardrobe_file).wardrobe.articles_by_oid.values() ]
+    assert 'committed' in descriptions
+    assert 'failed' not in descriptions
@@ -0,0 +1,39 @@
+import json
+
+from wardrobe import Article, Wardrobe
+
+
+def test_articles_are_compact_and_round_trip(articles):
+    article_json = articles['pants'][0]
+    article = Article.from_json(dict(article_json))
+    other = Article.from_json(json.loads(json.dumps(articles['pants'][1])))
+
+    assert not hasattr(article, '__dict__')
+    assert article.article_type is other.article_type      # interned, however the json was parsed
+
+    # jsonify gives the json the article was read from, as a new dict every time
+    dumped = article.jsonify()
+    assert dumped == article_json
+    dumped['colors'].append('red')
+    assert article.jsonify() == article_json
+
+
+def test_columns_follow_the_wardrobe(fixed, articles):
+    wardrobe = Wardrobe(fixed.article_map, articles)
+    columns = wardrobe.columns()
+    ordered = wardrobe.articles_for(wardrobe.articles_by_oid.keys())
+
+    assert columns.oids == [ article.oid for article in ordered ]
+
+    # each row decodes back to its article
+    decode = { attribute:{ code:value for value, code in codes.items() } for attribute, codes in columns.codes.items() }
+    for row, article in enumerate(ordered):
+        assert decode['article_type'][columns.article_type[row]] == article.article_type
+        assert decode['article_subtype'][columns.article_subtype[row]] == article.article_subtype
+        assert { decode['color'][code] for code in decode['color'] if columns.colors[row] >> code & 1 } == set(article.colors)
+        assert columns.price[row] == article.price
+
+    # a change drops the columns, the next ones include it
+    added = wardrobe.add_article(Article(None, 'pants', 'chinos', 'added', ['beige'], 'any', 25))
+    assert wardrobe.columns() is not columns
+    assert added.oid in wardrobe.columns().rows
@@ -0,0 +1,48 @@
+import socket, threading
+
+from wardrobe import WardrobeDaemon, WardrobeGenerator
+
+
+def serve_once(socket_path, answer):
+    # a server on socket_path that hands its first connection to answer(connection)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+
+    def accept():
+        with server:
+            connection, address = server.accept()
+            answer(connection)
+
+    thread = threading.Thread(target=accept, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_import_streams_stdin(fixed, wardrobe_file, tmp_path):
+    generator = WardrobeGenerator.from_file(fixed, wardrobe_file)
+    socket_path = str(tmp_path / 'd.sock')
+    thread = serve_once(socket_path, WardrobeDaemon(generator, socket_path).answer)
+
+    import_filepath = tmp_path / 'import'
+    import_filepath.write_text('pants jeans "streamed" blue any 40$\npants chinos "streamed" beige any 30$\n')
+
+    with open(str(import_filepath), 'rb') as stdin:
+        response = WardrobeDaemon.request(socket_path, { 'argv':['import', '-'], 'stream_stdin':True }, stdin)
+    thread.join()
+
+    assert response['status'] == 0
+    assert 'Imported 2 articles' in response['output']
+    assert sorted( article.article_subtype for article in generator.wardrobe.data['pants'] if article.description == 'streamed' ) == ['chinos', 'jeans']
+
+
+def test_daemon_that_does_not_answer(tmp_path):
+    socket_path = str(tmp_path / 'd.sock')
+    thread = serve_once(socket_path, lambda connection: connection.close())
+
+    # the request may have been applied, so it is reported as failed rather than run again in-process
+    response = WardrobeDaemon.request(socket_path, { 'control':'status' }, timeout=1)
+    thread.join()
+
+    assert response == { 'output':"The daemon did not respond\n", 'status':1 }
+    assert WardrobeDaemon.request(str(tmp_path / 'missing.sock'), { 'control':'status' }) is None
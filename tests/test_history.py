@@ -0,0 +1,84 @@
+from wardrobe import JsonStorage, OutfitHistory, WardrobeGenerator, WearIndex
+
+
+def article_oids(outfit):
+    return sorted( str(article.oid) for articles in outfit.articles.values() for article in articles )
+
+
+def with_history(fixed, wardrobe_file, n=6):
+    # n committed outfits; the pants of the last one are removed from the wardrobe afterwards
+    generator = WardrobeGenerator.from_file(fixed, wardrobe_file)
+    outfits = generator.generate_many({}, n, seed=3)
+
+    for outfit in outfits:
+        generator.wardrobe.add_outfit(outfit)
+    generator.commit()
+
+    generator.wardrobe.remove_article(outfits[-1].articles['pants'][0])
+    generator.commit()
+
+    return outfits
+
+
+def parse_everything(filepath):
+    raise AssertionError("the whole history was parsed")
+
+
+def test_history_is_only_parsed_when_read(fixed, wardrobe_file, monkeypatch):
+    outfits = with_history(fixed, wardrobe_file)
+    monkeypatch.setattr(OutfitHistory, 'read_records', parse_everything)
+
+    # loading, querying and generating leave the history file alone
+    generator = WardrobeGenerator.from_file(fixed, wardrobe_file)
+    history = generator.wardrobe.outfit_history
+    generator.wardrobe.select('pants')
+    added = generator.generate_many({}, 1, seed=4)[0]
+    generator.wardrobe.add_outfit(added)
+    generator.commit()
+    assert history.outfits is None
+
+    # last() reads the tail of the file, and resolves a removed article from its removal record
+    last = history.last(3)
+    assert history.outfits is None
+    assert [ str(outfit.oid) for outfit in last ] == [ str(outfit.oid) for outfit in outfits[-2:] + [added] ]
+    assert [ article_oids(outfit) for outfit in last ] == [ article_oids(outfit) for outfit in outfits[-2:] + [added] ]
+
+    monkeypatch.undo()
+    assert [ str(outfit.oid) for outfit in history ] == [ str(outfit.oid) for outfit in outfits + [added] ]
+
+
+def test_wear_index(fixed, wardrobe_file, monkeypatch):
+    outfits = with_history(fixed, wardrobe_file)
+    storage = JsonStorage(wardrobe_file)
+
+    # the index saved with the history is read without parsing the history, and matches one built from it
+    monkeypatch.setattr(OutfitHistory, 'read_records', parse_everything)
+    wardrobe = storage.open(fixed.article_map)
+    wear = wardrobe.outfit_history.wear_index()
+    monkeypatch.undo()
+
+    built = WearIndex.build(storage.open(fixed.article_map).outfit_history)
+    assert (wear.outfits, wear.worn) == (built.outfits, built.worn) and wear.outfits == len(outfits)
+
+    # the more recently an article was worn the less often it is drawn, one never worn is drawn as often as ever
+    worn = outfits[-1].articles['footwear'][0]
+    earlier = max(wear.worn, key=wear.outfits_since)
+    assert wear.outfits_since(worn.oid) == 0 < wear.outfits_since(earlier)
+    assert wear.weight(worn.oid) < wear.weight(earlier) <= 1.0
+    assert wear.weight('00000000-0000-0000-0000-999999999999') == 1.0
+
+    # an outfit is counted as it is added, and the index saved with it is read back as it is
+    added = WardrobeGenerator.from_loaded(fixed, wardrobe).generate_many({}, 1, seed=5)[0]
+    wardrobe.add_outfit(added)
+    storage.commit(wardrobe)
+    assert wear.outfits == len(outfits) + 1
+
+    saved = storage.open(fixed.article_map).outfit_history.read_wear()
+    assert (saved.outfits, saved.worn) == (wear.outfits, wear.worn)
+
+    # a history file changed behind the index's back no longer matches it, the index is rebuilt from the history
+    with open(storage.history_filepath, 'ab') as history:
+        history.write(b'\n')
+    history = storage.open(fixed.article_map).outfit_history
+    assert history.read_wear() is None
+    assert history.wear_index().worn == wear.worn
@@ -0,0 +1,38 @@
+from wardrobe import WardrobeGenerator
+
+LINES = [
+    'pants jeans "imported" blue any 40$',
+    'pants jeans "imported" blue any 40$',     # a genuine duplicate, e.g. two identical pairs
+    'footwear boots "imported" black brown cold 120$',
+    'pants skirt "unknown subtype" blue any 10$',
+]
+
+
+def imported(wardrobe):
+    return sorted( (article.article_type, article.article_subtype, article.weather, article.price)
+                   for article in wardrobe.articles_for(wardrobe.articles_by_oid.keys()) if article.description == 'imported' )
+
+
+def test_reimport_is_idempotent(fixed, wardrobe_file):
+    generator = WardrobeGenerator.from_file(fixed, wardrobe_file)
+
+    added, rejected = generator.import_articles(LINES)
+    assert added == 3
+    assert [ line_number for line_number, reason, line in rejected ] == [4]
+
+    # the same file again, from a new process: nothing is added
+    generator = WardrobeGenerator.from_file(fixed, wardrobe_file)
+    size = len(generator.wardrobe.articles_by_oid)
+    added, rejected = generator.import_articles(LINES)
+    assert added == 0
+    assert len(generator.wardrobe.articles_by_oid) == size
+
+    # a changed price updates the matching article in place (colors in any order), a third identical line adds one
+    boots = [ str(article.oid) for article in generator.wardrobe.data['footwear'] if article.description == 'imported' ]
+    added, rejected = generator.import_articles(LINES[:1] + ['footwear boots "imported" brown black cold 150$'] + LINES[:2])
+    assert added == 1
+
+    reopened = WardrobeGenerator.from_file(fixed, wardrobe_file).wardrobe
+    assert [ str(article.oid) for article in reopened.data['footwear'] if article.description == 'imported' ] == boots
+    assert imported(reopened) == [
+        ('footwear', 'boots', 'cold', 150), ('pants', 'jeans', 'any', 40), ('pants', 'jeans', 'any', 40), ('pants', 'jeans', 'any', 40) ]
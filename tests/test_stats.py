@@ -0,0 +1,39 @@
+import wardrobe as wardrobe_module
+from wardrobe import WardrobeGenerator, format_stats, reset_stats, stats_snapshot
+
+
+def generate(fixed, wardrobe_file):
+    generator = WardrobeGenerator.from_file(fixed, wardrobe_file)
+    for outfit in generator.generate_many({ 'weather':'cold' }, 2, seed=1):
+        generator.wardrobe.add_outfit(outfit)
+    generator.commit()
+
+
+def test_nothing_is_collected_while_stats_are_off(fixed, wardrobe_file, monkeypatch):
+    monkeypatch.setattr(wardrobe_module, 'STATS', False)
+    reset_stats()
+
+    generate(fixed, wardrobe_file)
+
+    assert stats_snapshot() == { 'timers':{}, 'counters':{} }
+
+
+def test_hot_path_timers_and_counters(fixed, wardrobe_file, articles, monkeypatch):
+    monkeypatch.setattr(wardrobe_module, 'STATS', True)
+    reset_stats()
+
+    generate(fixed, wardrobe_file)
+    stats = stats_snapshot()
+
+    # one filter pass for the whole batch, over every article of every type
+    total = sum( len(type_articles) for type_articles in articles.values() )
+    assert stats['counters']['articles.loaded'] == total
+    assert stats['counters']['filter.scanned'] == total
+    assert stats['counters']['filter.weather.kept'] < total
+    assert stats['timers']['generate.filter']['calls'] == 1
+    assert stats['timers']['generate.many']['calls'] == 1
+    assert all( timer['seconds'] >= 0 for timer in stats['timers'].values() )
+    assert 'generate.many' in format_stats()
+
+    reset_stats()
+    assert stats_snapshot() == { 'timers':{}, 'counters':{} }
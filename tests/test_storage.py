@@ -0,0 +1,215 @@
+import os
+
+import pytest
+
+import wardrobe as wardrobe_module
+from wardrobe import Article, JsonStorage, Outfit, SegmentedStorage, SqliteStorage, WardrobeGenerator, serializer, storage_for
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def contents(wardrobe):
+    # everything a storage has to keep: the articles in wardrobe order, and each outfit with its articles by type
+    articles = { article_type:[ article.jsonify() for article in type_articles ] for article_type, type_articles in wardrobe.data.items() if type_articles }
+    history = [ (str(outfit.oid), outfit.seed, outfit.criteria, { article_type:[ article.jsonify() for article in type_articles ] for article_type, type_articles in outfit.articles.items() })
+                for outfit in wardrobe.outfit_history ]
+    return articles, history
+
+
+def reopen(fixed, filepath):
+    return storage_for(filepath).open(fixed.article_map)
+
+
+def wardrobe_with_history(fixed, filepath):
+    # seeded outfits, one with a type left empty, and an article removed while an outfit still references it
+    wardrobe = reopen(fixed, filepath)
+    generator = WardrobeGenerator.from_loaded(fixed, wardrobe)
+
+    for outfit in generator.generate_many({}, 3, True, 5):
+        wardrobe.add_outfit(outfit)
+
+    partial = { article_type:[] for article_type in wardrobe.data.keys() }
+    partial['pants'] = [ wardrobe.data['pants'][0] ]
+    partial['footwear'] = [ wardrobe.data['footwear'][1] ]
+    wardrobe.add_outfit(Outfit(None, fixed.article_map, partial, 9, { 'weather':'cold' }))
+
+    wardrobe.remove_article(wardrobe.data['pants'][0])
+    storage_for(filepath).commit(wardrobe)
+
+    return wardrobe
+
+
+def test_json_sqlite_round_trip(fixed, wardrobe_file, tmp_path, monkeypatch):
+    expected = contents(wardrobe_with_history(fixed, wardrobe_file))
+    database = str(tmp_path / 'wardrobe.db')
+    copy = str(tmp_path / 'copy.json')
+
+    monkeypatch.chdir(ROOT)
+    WardrobeGenerator.handle_convert_cli([wardrobe_file, database])
+    WardrobeGenerator.handle_convert_cli([database, copy])
+
+    assert contents(reopen(fixed, database)) == expected
+    assert contents(reopen(fixed, copy)) == expected
+
+    # the removed article is only kept for the outfits that reference it, and an empty type keeps its slot
+    removed_oid = expected[1][3][3]['pants'][0]['oid']
+    assert removed_oid not in [ article['oid'] for article in expected[0]['pants'] ]
+    assert expected[1][3][3]['headwear'] == []
+
+
+def test_sqlite_commit_applies_journal(fixed, wardrobe_file, tmp_path):
+    database = str(tmp_path / 'wardrobe.db')
+    SqliteStorage(database).export(reopen(fixed, wardrobe_file))
+
+    storage = SqliteStorage(database)
+    wardrobe = storage.open(fixed.article_map)
+    referenced, unreferenced = wardrobe.data['footwear'][0], wardrobe.data['footwear'][1]
+
+    added = wardrobe.add_article(Article(None, 'pants', 'chinos', 'added', ['beige'], 'any', 25))
+    wardrobe.update_article(wardrobe.data['outerwear'][0], weather='wet', price=99)
+    wardrobe.add_outfit(Outfit(None, fixed.article_map, { 'footwear':[referenced], 'pants':[added] }, 3, {}))
+    wardrobe.remove_article(referenced)
+    wardrobe.remove_article(unreferenced)
+    storage.commit(wardrobe)
+
+    assert wardrobe.journal == []
+    assert contents(reopen(fixed, database)) == contents(wardrobe)
+
+    # a removed article keeps a row, marked removed, only while an outfit references it
+    rows = dict(storage.connect().execute('SELECT oid, removed FROM articles WHERE oid IN (?, ?)', (str(referenced.oid), str(unreferenced.oid))).fetchall())
+    assert rows == { str(referenced.oid):1 }
+
+    # indexed queries see the update and the removal
+    assert [ article['oid'] for article in storage.load('outerwear', weather='wet')['outerwear'] ] == [ str(wardrobe.data['outerwear'][0].oid) ]
+    assert str(unreferenced.oid) not in [ article['oid'] for article in storage.load('footwear').get('footwear', []) ]
+
+
+def edit(wardrobe):
+    # changes to several types: an add, a delete, an update, and an add to another type
+    wardrobe.add_article(Article(None, 'pants', 'chinos', 'added', ['beige'], 'any', 25))
+    wardrobe.remove_article(wardrobe.data['footwear'][0])
+    wardrobe.update_article(wardrobe.data['outerwear'][1], weather='wet', price=99)
+    wardrobe.add_article(Article(None, 'accessory', 'ring', 'added', ['silver'], 'any', 5))
+
+
+def test_snapshot_segments_match_full_dump(fixed, wardrobe_file):
+    storage = JsonStorage(wardrobe_file)
+    wardrobe = storage.open(fixed.article_map)
+    storage.save(wardrobe)
+
+    edit(wardrobe)
+    storage.save(wardrobe)
+    with open(wardrobe_file, 'rb') as snapshot:
+        assert snapshot.read() == serializer().dumps(wardrobe.dump())
+
+    # a type that becomes empty is left out, like dump() leaves it out
+    for article in list(wardrobe.data['headwear']):
+        wardrobe.remove_article(article)
+    edit(wardrobe)
+    storage.save(wardrobe)
+    with open(wardrobe_file, 'rb') as snapshot:
+        assert snapshot.read() == serializer().dumps(wardrobe.dump())
+
+
+def test_segment_files_match_full_dump(fixed, wardrobe_file, tmp_path):
+    directory = str(tmp_path / 'wardrobe.d')
+    SegmentedStorage(directory).export(storage_for(wardrobe_file).open(fixed.article_map))
+
+    storage = SegmentedStorage(directory)
+    wardrobe = storage.open(fixed.article_map)
+    edit(wardrobe)
+    storage.save(wardrobe)
+
+    for article_type, articles in wardrobe.data.items():
+        with open(storage.segment_filepath(article_type), 'rb') as segment:
+            assert segment.read() == serializer().dumps([ article.jsonify() for article in articles ])
+
+
+def segmented_with_journal(fixed, wardrobe_file, directory):
+    # a segmented wardrobe with edits in its journal, and the wardrobe those edits lead to
+    SegmentedStorage(directory).export(storage_for(wardrobe_file).open(fixed.article_map))
+
+    storage = SegmentedStorage(directory)
+    wardrobe = storage.open(fixed.article_map)
+    edit(wardrobe)
+    storage.commit(wardrobe, compact=False)
+    assert os.path.exists(storage.journal_filepath)
+
+    return storage, wardrobe
+
+
+def assert_recovered(fixed, directory, expected):
+    recovered = SegmentedStorage(directory).open(fixed.article_map)
+    oids = [ str(article.oid) for articles in recovered.data.values() for article in articles ]
+
+    assert len(oids) == len(set(oids))
+    assert contents(recovered) == contents(expected)
+
+
+def test_segments_written_before_journal_removed(fixed, wardrobe_file, tmp_path):
+    # every segment was written, the crash came before the journal was removed
+    directory = str(tmp_path / 'wardrobe.d')
+    storage, wardrobe = segmented_with_journal(fixed, wardrobe_file, directory)
+
+    storage.write_snapshot(wardrobe)
+
+    assert os.path.exists(storage.journal_filepath)
+    assert_recovered(fixed, directory, wardrobe)
+
+
+def test_crash_between_segment_writes(fixed, wardrobe_file, tmp_path, monkeypatch):
+    # the first two changed segments (outerwear, pants) were written, footwear and accessory were not
+    directory = str(tmp_path / 'wardrobe.d')
+    storage, wardrobe = segmented_with_journal(fixed, wardrobe_file, directory)
+
+    atomic_write = wardrobe_module.atomic_write
+    writes = []
+
+    def crashing_write(filepath, content):
+        if len(writes) == 2:
+            raise OSError("crashed")
+        writes.append(filepath)
+        atomic_write(filepath, content)
+
+    monkeypatch.setattr(wardrobe_module, 'atomic_write', crashing_write)
+    with pytest.raises(OSError):
+        storage.save(wardrobe)
+    monkeypatch.undo()
+
+    assert [ os.path.basename(filepath) for filepath in writes ] == ['outerwear.json', 'pants.json']
+    assert os.path.exists(storage.journal_filepath)
+    assert_recovered(fixed, directory, wardrobe)
+
+
+def test_failed_commit_takes_history_back(fixed, wardrobe_file, monkeypatch):
+    storage = JsonStorage(wardrobe_file)
+    wardrobe = storage.open(fixed.article_map)
+    first, second = WardrobeGenerator.from_loaded(fixed, wardrobe).generate_many({}, 2, seed=1)
+
+    wardrobe.add_outfit(first)
+    storage.commit(wardrobe)
+    committed = contents(reopen(fixed, wardrobe_file))
+    with open(storage.history_filepath, 'rb') as history:
+        history_before = history.read()
+
+    # the history is appended, then writing the journal fails
+    wardrobe.add_outfit(second)
+    wardrobe.add_article(Article(None, 'pants', 'chinos', 'added', ['beige'], 'any', 25))
+
+    def failing_append(wardrobe):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, 'append_journal', failing_append)
+    with pytest.raises(OSError):
+        storage.commit(wardrobe)
+    monkeypatch.undo()
+
+    with open(storage.history_filepath, 'rb') as history:
+        assert history.read() == history_before
+    assert contents(reopen(fixed, wardrobe_file)) == committed
+
+    # nothing was lost in memory, the next commit writes both
+    storage.commit(wardrobe)
+    reopened = reopen(fixed, wardrobe_file)
+    assert contents(reopened) == contents(wardrobe)
+    assert reopened.outfit_history.wear_index().outfits == 2
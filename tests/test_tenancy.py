@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from wardrobe import Article, WardrobeGenerator, WardrobeTenancy
+
+
+def add_article(tenancy, user_id, description):
+    return tenancy.wardrobe_for(user_id).add_article(Article(None, 'pants', 'jeans', description, ['blue'], 'any', 40))
+
+
+def test_least_recently_used_wardrobe_is_evicted(fixed, tmp_path):
+    directory = str(tmp_path / 'wardrobes')
+    tenancy = WardrobeTenancy(fixed, directory, capacity=2)
+
+    add_article(tenancy, 'alice', 'for alice')
+    added = add_article(tenancy, 'bob', 'for bob')
+    tenancy.wardrobe_for('alice')       # alice is now the most recently used
+
+    # loading carol evicts bob, whose change is committed on the way out
+    carol = tenancy.generator_for('carol')
+    assert list(tenancy.generators) == ['alice', 'carol']
+    assert carol.fixed is fixed and tenancy.generator_for('alice').fixed is fixed
+
+    bob = WardrobeGenerator.from_file(fixed, WardrobeTenancy.filepath_for('bob', directory))
+    assert str(added.oid) in bob.wardrobe.articles_by_oid
+
+    # alice's change is still only in memory, and nothing was written for carol
+    assert not os.path.exists(WardrobeTenancy.filepath_for('alice', directory))
+    assert not os.path.exists(WardrobeTenancy.filepath_for('carol', directory))
+
+    tenancy.close()
+    assert len(tenancy) == 0
+    assert [ article.description for article in WardrobeGenerator.from_file(fixed, WardrobeTenancy.filepath_for('alice', directory)).wardrobe.data['pants'] ] == ['for alice']
+
+
+def test_failed_eviction_keeps_the_wardrobe(fixed, tmp_path, monkeypatch):
+    tenancy = WardrobeTenancy(fixed, str(tmp_path / 'wardrobes'), capacity=1)
+    add_article(tenancy, 'alice', 'for alice')
+
+    def failing_commit(compact=True):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tenancy.generator_for('alice'), 'commit', failing_commit)
+    with pytest.raises(OSError):
+        tenancy.generator_for('bob')
+
+    # alice's uncommitted change is not dropped with her wardrobe
+    assert list(tenancy.generators) == ['alice']
+    assert tenancy.wardrobe_for('alice').journal
+
+    with pytest.raises(ValueError):
+        tenancy.generator_for('../alice')
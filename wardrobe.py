@@ -1,14 +1,103 @@
 
-import json, os, platform, sys, random, uuid
-from pprint import pprint
+import sys, time
+STARTUP_MARKS = [ ('start', time.perf_counter()) ]    # (phase, time it ended) for --profile-startup
+
+# random, uuid, hashlib, marshal, tempfile and heapq are imported where they are used,
+# so commands that do not need them (e.g. help) start faster
+import json, os, itertools, re
+from array import array
 from typing import *
+STARTUP_MARKS.append(('imports', time.perf_counter()))
 
 DEBUG = False
-PRETTY = True
+PRETTY = True                       # 'export' writes indented json, the wardrobe file itself is always compact
+JOURNAL = True                      # append mutations to '<wardrobe>.journal' instead of rewriting the wardrobe file
+JOURNAL_COMPACT_THRESHOLD = 50      # number of journal records before they are folded into a fresh snapshot
+IMPORT_BATCH_SIZE = 1000           # imported articles are committed to the journal in batches of this size
+GENERATION_BUDGET = 250000          # color checks the compatible outfit search may make before returning what it found (about 0.05s)
+MAX_OUTFITS = 1000                  # outfits a single generate call, or catalogue combination, may ask for
+RECENCY_WINDOW = 7                  # outfits after which a worn article is drawn as often as any other again, with 'engine:fresh'
+BACKEND = 'auto'                    # filtering/scoring backend: 'python', 'numpy', or 'auto' (numpy for large wardrobes when installed)
+COLUMNAR_MIN_ARTICLES = 5000        # wardrobe size from which 'auto' switches to the numpy backend
+NUMPY = None                        # numpy module once loaded, False if it is not installed
+SERIALIZER = 'auto'                 # json library for wardrobe, journal and history files: 'json', 'orjson', or 'auto' (orjson when installed)
+ORJSON = None                       # orjson module once loaded, False if it is not installed
+PROFILE_STARTUP = False             # print a per-phase timing breakdown of a CLI call to stderr, '--profile-startup'
+DAEMON = True                       # forward CLI calls to a running daemon, '--no-daemon' runs them in-process
+DAEMON_FLUSH_INTERVAL = 2.0         # seconds the daemon may hold mutations in memory before committing them
+DAEMON_CLIENT_TIMEOUT = 2.0         # seconds the daemon waits on a connected client before dropping it
+DAEMON_REQUEST_TIMEOUT = 60.0       # seconds a CLI call waits on the daemon before reporting that it did not respond
+USER = None                         # whose wardrobe the CLI works on, '--user <id>'; None for WARDROBE
+WARDROBE = 'wardrobe.json'          # the CLI's wardrobe, '--wardrobe <file>'; '.db', '.sqlite' and '.sqlite3' files are SQLite databases
+TENANT_DIRECTORY = 'wardrobes'      # per-user wardrobes live in '<directory>/<shard>/<user id>', with WARDROBE's extension
+TENANT_CACHE_SIZE = 64              # per-user wardrobes kept loaded by a long-running process, least recently used are evicted
+STATS = os.environ.get('WARDROBE_STATS', '0') != '0'    # collect hot-path timers and counters, '--stats' or WARDROBE_STATS=1
+STATS_JSON = os.environ.get('WARDROBE_STATS') == 'json' # report them as json, '--stats-json' or WARDROBE_STATS=json
+
+TIMERS = {}     # name -> [calls, seconds], collected while STATS is set
+COUNTERS = {}   # name -> total, collected while STATS is set
+
+
+class Timer():
+
+    # adds the time spent inside a with block to TIMERS
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        timer = TIMERS.setdefault(self.name, [0, 0.0])
+        timer[0] += 1
+        timer[1] += time.perf_counter() - self.start
+
+
+class NoTimer():
+
+    # what timed() hands out while stats are off, one shared instance that does nothing
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+NO_TIMER = NoTimer()
+
+
+def timed(name: str):
+    # with timed('stage'): ...
+    return Timer(name) if STATS else NO_TIMER
+
+
+def timer(name: str):
+    # decorator form of timed(), while stats are off a call costs one extra check
+    def decorate(function):
+        def timed_function(*args, **kwargs):
+            if not STATS:
+                return function(*args, **kwargs)
+            with Timer(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorate
+
+
+def count(name: str, n: int =1):
+    # callers check STATS first, so nothing is computed for a counter while stats are off
+    COUNTERS[name] = COUNTERS.get(name, 0) + n
 
 
 class Article():
 
+    # no per-instance __dict__, and the repeated type/subtype/color/weather strings are interned,
+    # which keeps large catalogues small in memory
+    __slots__ = ('oid', 'article_type', 'article_subtype', 'description', 'weather', 'price', 'colors')
+
     def __init__(self,  oid: str,
                         article_type : str, 
                         subtype: str, 
@@ -17,24 +106,34 @@ class Article():
                         weather : List[str], 
                         price : float):
 
-        self.oid = oid if oid else uuid.uuid4()
+        if not oid:
+            import uuid
+            oid = uuid.uuid4()
 
-        self.article_type = article_type
-        self.article_subtype = subtype
+        self.oid = str(oid)
+
+        self.article_type = sys.intern(article_type)
+        self.article_subtype = sys.intern(subtype)
         self.description = description
-        self.weather = weather
+        self.weather = [ sys.intern(w) for w in weather ] if type(weather) == type([]) else sys.intern(weather)
         self.price = price
-        self.colors = [ c.lower() for c in colors] if type(colors) == type([]) else []
+        self.colors = tuple( sys.intern(c.lower()) for c in colors ) if type(colors) in (type([]), type(())) else ()
 
     def from_json(json: Dict):
         try:
-            oid = uuid.uuid4() if 'oid' not in json else uuid.UUID(json['oid'])
+            oid = json.get('oid')
 
             return Article(oid, json['article_type'], json['article_subtype'], json['description'], json['colors'], json['weather'], json['price'])
         except KeyError as ke:
             print("Error while importing from JSON \n{0}\n".format(json))
             print(ke)
 
+    def content_key(self) -> str:
+        # stable identity of an article's contents, independent of its oid
+        import hashlib
+        content = '|'.join([ self.article_type, self.article_subtype, self.description, ','.join(sorted(self.colors)) ])
+        return hashlib.sha1(content.encode()).hexdigest()
+
     def summary(self) -> str:
         main_line = "{0} {1} {2}".format((','.join(self.colors) if self.colors else "").capitalize(), self.description.capitalize(), self.article_subtype.capitalize(), )
         summary = "{0:55}|(${3}|{1}|{2})".format(main_line, self.article_type, "{0} weather".format(self.weather), self.price)
@@ -44,15 +143,22 @@ class Article():
     def __str__(self):
         return self.summary()
 
-    def jsonify(self):
-        data = self.__dict__
-        data['oid'] = str(data['oid'])
-
-        return data
+    def jsonify(self) -> Dict:
+        # a new dict every time, serializing never changes the article
+        return {
+            'oid': self.oid,
+            'article_type': self.article_type,
+            'article_subtype': self.article_subtype,
+            'description': self.description,
+            'weather': list(self.weather) if type(self.weather) == type([]) else self.weather,
+            'price': self.price,
+            'colors': list(self.colors)
+        }
 
 class Outfit():
 
-    def __init__(self, oid, article_map, articles: List[Article]):
+    def __init__(self, oid, article_map, articles: List[Article], seed: int =None, criteria: Dict[str, str] =None):
+        import uuid
 
         self.oid = uuid.uuid4() if not oid else oid
 
@@ -61,7 +167,12 @@ class Outfit():
 
         self.articles = articles
 
-    def from_json(article_map, outfit_json: Dict):
+        # the seed and criteria the outfit was generated with, enough to regenerate it
+        self.seed = seed
+        self.criteria = criteria
+
+    def from_json(article_map, outfit_json: Dict, article_lookup: Dict[str, Article] ={}):
+        import uuid
 
         articles = {}
         oid = uuid.uuid1()
@@ -72,22 +183,50 @@ class Outfit():
                 oid = uuid.UUID(article)
                 continue
 
+            if article_type in ('seed', 'criteria'):
+                continue
+
             items = []
 
-            if type(article) == type({}):
+            if type(article) in (type({}), type("")):
                 items.append(article)
             elif type(article) == type([]):
                 items = article
 
-            articles[article_type] = [ Article.from_json(item) for item in items ]
+            articles[article_type] = [ resolved for resolved in (Outfit.resolve_article(item, article_lookup) for item in items) if resolved ]
+
+        return Outfit( oid, article_map, articles, outfit_json.get('seed'), outfit_json.get('criteria') )
+
+    def key(articles: Dict[str, List[Article]]) -> Tuple[str, ...]:
+        # identifies an outfit by its contents, regardless of its own oid
+        return tuple(sorted( str(article.oid) for selected in articles.values() for article in selected ))
 
-        return Outfit( oid, article_map, articles )
+    def resolve_article(item, article_lookup: Dict[str, Article]):
 
-    def dump(self):
-        data = { article_type:[ article.jsonify() for article in articles ] for article_type, articles in self.articles.items() }
+        # current format: a reference to an article oid in the wardrobe
+        if type(item) == type(""):
+            if item in article_lookup:
+                return article_lookup[item]
+
+            debug("Outfit references unknown article", item)
+            return None
+
+        # legacy format: a full embedded copy of the article, share the wardrobe's instance when it still exists
+        if type(item) == type({}) and item.get('oid') in article_lookup:
+            return article_lookup[item['oid']]
+
+        return Article.from_json(item)
+
+    def dump(self, article_lookup: Dict[str, Article] ={}):
+        # articles still in the wardrobe are stored by reference, removed ones keep an embedded copy
+        data = { article_type:[ str(article.oid) if str(article.oid) in article_lookup else article.jsonify() for article in articles ] for article_type, articles in self.articles.items() }
 
         data['oid'] = str(self.oid)
 
+        if self.seed is not None:
+            data['seed'] = self.seed
+            data['criteria'] = self.criteria
+
         return data
 
     def __str__(self):
@@ -102,17 +241,473 @@ class Outfit():
         return summary
 
 
+class WearIndex():
+
+    # how often each article was worn, and the outfit it was last worn in (outfits are numbered from 1 in history order).
+    # kept current as outfits are added, so reading it never scans the history
+
+    def __init__(self, outfits: int =0, worn: Dict[str, List[int]] =None):
+        self.outfits = outfits          # outfits recorded, the number of the most recent one
+        self.worn = worn or {}          # article oid -> [times worn, number of the outfit it was last worn in]
+
+    def build(outfits: Iterable[Outfit]):
+        wear = WearIndex()
+        for outfit in outfits:
+            wear.record(outfit)
+        return wear
+
+    def record(self, outfit: Outfit):
+        self.outfits += 1
+        for articles in outfit.articles.values():
+            for article in articles:
+                entry = self.worn.setdefault(str(article.oid), [0, 0])
+                entry[0] += 1
+                entry[1] = self.outfits
+
+    def outfits_since(self, oid) -> int:
+        # outfits added since the article was last worn, None if it never was
+        entry = self.worn.get(str(oid))
+        return None if entry is None else self.outfits - entry[1]
+
+    def weight(self, oid) -> float:
+        # articles worn in the last RECENCY_WINDOW outfits are drawn less often, the more recently worn the less
+        since = self.outfits_since(oid)
+        if since is None or since >= RECENCY_WINDOW:
+            return 1.0
+        return (since + 1) / (RECENCY_WINDOW + 1)
+
+    def most_worn(self) -> List[Tuple[str, int, int]]:
+        # (oid, times worn, outfits since) for every article that was worn, most worn first
+        return [ (oid, worn, self.outfits - last) for oid, (worn, last) in sorted(self.worn.items(), key=lambda entry: (-entry[1][0], -entry[1][1], entry[0])) ]
+
+
+class OutfitHistory():
+
+    # outfit history kept out of the wardrobe file, in '<wardrobe>.history' with one json record per line.
+    # nothing is parsed until the history is read, and last() only parses the tail of the file.
+    # a line is either an outfit, or an article that was removed after outfits referenced it.
+    # the wear index is saved beside it in '<history>.wear', with the size of the history file it was written for
+
+    def __init__(self, article_map, article_lookup: Dict[str, Article], filepath: str =None, inline: List[Dict] =None):
+        self.article_map = article_map
+        self.article_lookup = article_lookup    # the wardrobe's articles by oid, history stores references into it
+        self.filepath = filepath
+        self.wear_filepath = "{0}.wear".format(filepath) if filepath else None
+        self.wear = None        # WearIndex, once read
+        self.wear_unsaved = False   # the wear index was rebuilt, it is saved with the next write
+
+        self.inline = [ outfit_data for outfit_data in inline or [] if outfit_data ]   # older wardrobe files keep history inline
+        self.migrate = bool(self.inline)    # the wardrobe file or its journal still hold history, it is moved out on the next write
+        self.outfits = None     # every outfit, oldest first, once loaded
+        self.pending = []       # records not yet written to the history file
+        self.removed = {}       # articles removed during this session, by oid
+        self.rewrite = False    # the history was cleared, the file must be rewritten instead of appended to
+        self.appended = None    # (file size before, records) of the last flush's append, until the commit it is part of is done
+
+    def load(self) -> List[Outfit]:
+        if self.outfits is None:
+            # a cleared history is loaded already, so whatever is on disk is still current
+            records = list(self.inline)
+            if self.filepath and os.path.exists(self.filepath):
+                with timed('history.parse'):
+                    records += OutfitHistory.read_records(self.filepath)
+
+            self.outfits = self.resolve(records)
+            self.outfits += [ record for record in self.pending if type(record) == Outfit ]
+
+        return self.outfits
+
+    def resolve(self, records: List[Dict]) -> List[Outfit]:
+        # articles removed from the wardrobe are resolved from their removal records
+        removed = { record['removed_article']['oid']:Article.from_json(record['removed_article']) for record in records if 'removed_article' in record }
+        lookup = dict(removed, **self.removed)
+        lookup.update(self.article_lookup)
+
+        outfits = []
+        seen = set()
+        for record in records:
+            if 'removed_article' in record:
+                continue
+            # a crash while moving inline history out can leave an outfit in both places
+            if record.get('oid') in seen:
+                continue
+            seen.add(record.get('oid'))
+            outfits.append(Outfit.from_json(self.article_map, record, lookup))
+
+        return outfits
+
+    def read_records(filepath: str) -> List[Dict]:
+        loads = serializer().loads
+        records = []
+        with open(filepath, 'rb') as history:
+            for line_number, line in enumerate(history, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(loads(line))
+                except json.JSONDecodeError as jsonde:
+                    print("Ignoring corrupt history record at {0}:{1}".format(filepath, line_number))
+                    debug(jsonde)
+        return records
+
+    def reverse_lines(filepath: str, block_size: int =65536):
+        # lines of a file from the last one backwards, reading only as many blocks as are consumed
+        with open(filepath, 'rb') as history:
+            position = history.seek(0, os.SEEK_END)
+            remainder = b''
+
+            while position > 0:
+                size = min(block_size, position)
+                position -= size
+                history.seek(position)
+
+                lines = (history.read(size) + remainder).split(b'\n')
+                remainder = lines.pop(0)
+
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line.decode()
+
+            if remainder.strip():
+                yield remainder.decode()
+
+    def last(self, n: int) -> List[Outfit]:
+        # the n most recent outfits, oldest first
+        if self.outfits is not None:
+            return self.outfits[-n:] if n > 0 else []
+
+        recent = [ record for record in self.pending if type(record) == Outfit ][-n:] if n > 0 else []
+        needed = n - len(recent)
+        records = []
+
+        if needed > 0 and self.filepath and os.path.exists(self.filepath):
+            # removal records always come after the outfits that reference the article, so the tail has them
+            found = 0
+            for line in OutfitHistory.reverse_lines(self.filepath):
+                try:
+                    record = serializer().loads(line)
+                except json.JSONDecodeError as jsonde:
+                    debug("Ignoring corrupt history record", jsonde)
+                    continue
+                records.append(record)
+                if 'removed_article' not in record:
+                    found += 1
+                    if found == needed:
+                        break
+            records.reverse()
+            needed -= found
+
+        if needed > 0 and self.inline:
+            records = self.inline[-needed:] + records
+
+        return self.resolve(records) + recent
+
+    def wear_index(self) -> WearIndex:
+        if self.wear is None:
+            self.wear = self.read_wear()
+
+            if self.wear is None:
+                # no index yet, or the history was written without updating it: built once from the history
+                debug("rebuilding wear index")
+                with timed('history.wear.rebuild'):
+                    self.wear = WearIndex.build(self.load())
+                self.wear_unsaved = bool(self.wear_filepath)
+            else:
+                for record in self.pending:
+                    if type(record) == Outfit:
+                        self.wear.record(record)
+
+        return self.wear
+
+    def read_wear(self) -> WearIndex:
+        # the saved index, None when it is missing or does not match the history file
+        if not self.wear_filepath or self.inline or not os.path.exists(self.wear_filepath):
+            return None
+
+        history_bytes = os.path.getsize(self.filepath) if os.path.exists(self.filepath) else 0
+        try:
+            with open(self.wear_filepath, 'rb') as wear_file:
+                content = serializer().loads(wear_file.read())
+        except json.JSONDecodeError as jsonde:
+            debug("Ignoring corrupt wear index", jsonde)
+            return None
+
+        if content.get('history_bytes') != history_bytes:
+            return None
+
+        return WearIndex(content['outfits'], content['worn'])
+
+    def write_wear(self):
+        history_bytes = os.path.getsize(self.filepath) if os.path.exists(self.filepath) else 0
+        atomic_write(self.wear_filepath, serializer().dumps({ 'history_bytes':history_bytes, 'outfits':self.wear.outfits, 'worn':self.wear.worn }))
+
+    def append(self, outfit: Outfit):
+        self.pending.append(outfit)
+        if self.outfits is not None:
+            self.outfits.append(outfit)
+        # a wear index that is not read yet picks pending outfits up when it is
+        if self.wear is not None:
+            self.wear.record(outfit)
+
+    def append_legacy(self, outfit_data: Dict):
+        # an outfit from a journal written before history had its own file
+        self.inline.append(outfit_data)
+        self.migrate = True
+        self.wear = None
+        if self.outfits is not None:
+            self.outfits += self.resolve([outfit_data])
+
+    def article_removed(self, article: Article, persist=True):
+        # replayed removals were written to the history file when they happened
+        self.removed[str(article.oid)] = article
+        if persist:
+            self.pending.append({ 'removed_article':article.jsonify() })
+
+    def clear(self):
+        self.inline = []
+        self.outfits = []
+        self.pending = []
+        self.rewrite = True
+        self.wear = WearIndex()
+
+    def dirty(self) -> bool:
+        return bool(self.pending) or self.rewrite or self.wear_unsaved
+
+    def flush(self):
+        # append pending records to the history file, or rewrite it after a clear or when moving inline history out
+        if not self.filepath:
+            return
+
+        dumps = serializer().dumps
+
+        # read before the history file changes, the saved index only matches the file as it is now
+        changed = self.dirty() or self.migrate
+        if changed:
+            self.wear_index()
+
+        if self.rewrite or self.migrate:
+            atomic_write(self.filepath, b''.join( dumps(outfit.dump(self.article_lookup))+b'\n' for outfit in self.load() ))
+            self.inline = []
+            self.rewrite = False
+            self.migrate = False
+        elif self.pending:
+            lines = [ dumps(record.dump(self.article_lookup) if type(record) == Outfit else record)+b'\n' for record in self.pending ]
+            self.appended = (os.path.getsize(self.filepath) if os.path.exists(self.filepath) else 0, self.pending)
+            self.pending = []
+            with open(self.filepath, 'ab') as history:
+                history.write(b''.join(lines))
+                history.flush()
+                os.fsync(history.fileno())
+
+        if changed:
+            self.write_wear()
+            self.wear_unsaved = False
+
+        self.pending = []
+
+    def rollback(self):
+        # the commit the last flush was part of failed: its records are cut off the history file and pending again,
+        # the next flush appends them and saves the wear index (which still counts them) for the new file size
+        if self.appended is None:
+            return
+
+        history_bytes, records = self.appended
+        self.appended = None
+
+        if history_bytes is not None:
+            truncate(self.filepath, history_bytes)
+        self.pending = records + self.pending
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __getitem__(self, index):
+        return self.load()[index]
+
+
+class SqliteOutfitHistory(OutfitHistory):
+
+    # outfit history in a SqliteStorage database, one row per outfit joined to its articles.
+    # a removed article keeps its row (marked removed) while outfits still reference it
+
+    def __init__(self, storage, article_map, article_lookup: Dict[str, Article]):
+        OutfitHistory.__init__(self, article_map, article_lookup)
+        self.storage = storage
+
+    def load(self) -> List[Outfit]:
+        if self.outfits is None:
+            self.outfits = self.select()
+            self.outfits += [ record for record in self.pending if type(record) == Outfit ]
+
+        return self.outfits
+
+    def select(self, limit: int =-1) -> List[Outfit]:
+        # the most recent outfits in the database, oldest first; -1 selects all of them
+        connection = self.storage.connect()
+        recent = 'SELECT oid FROM outfits ORDER BY sequence DESC LIMIT ?'
+
+        records = {}
+        for oid, seed, criteria in connection.execute('SELECT oid, seed, criteria FROM outfits WHERE oid IN ({0}) ORDER BY sequence'.format(recent), (limit,)):
+            records[oid] = { 'oid':oid, 'seed':seed, 'criteria':json.loads(criteria) if criteria else None }
+
+        for outfit_oid, article_type, article_oid in connection.execute('SELECT outfit_oid, article_type, article_oid FROM outfit_articles WHERE outfit_oid IN ({0}) ORDER BY outfit_oid, slot'.format(recent), (limit,)):
+            articles = records[outfit_oid].setdefault(article_type, [])
+            if article_oid is not None:
+                articles.append(article_oid)
+
+        # resolved like removal records in the history file
+        removed = [ { 'removed_article':article } for article in self.storage.select_articles('removed = 1 AND oid IN (SELECT article_oid FROM outfit_articles WHERE outfit_oid IN ({0}))'.format(recent), (limit,)) ]
+
+        return self.resolve(removed + list(records.values()))
+
+    def last(self, n: int) -> List[Outfit]:
+        if self.outfits is not None or n <= 0:
+            return OutfitHistory.last(self, n)
+
+        recent = [ record for record in self.pending if type(record) == Outfit ][-n:]
+        needed = n - len(recent)
+
+        return (self.select(needed) if needed > 0 else []) + recent
+
+    def read_wear(self) -> WearIndex:
+        # the article_wear rows, kept by insert_outfit in the same transaction as the outfits
+        connection = self.storage.connect()
+        outfits = connection.execute('SELECT COALESCE(MAX(sequence), -1) + 1 FROM outfits').fetchone()[0]
+
+        if outfits and not connection.execute('SELECT 1 FROM article_wear LIMIT 1').fetchone():
+            # a database written before the table existed, filled once from the outfits
+            with connection:
+                connection.execute('INSERT INTO article_wear SELECT article_oid, COUNT(*), MAX(sequence) + 1 FROM outfit_articles JOIN outfits ON outfits.oid = outfit_oid '
+                                   'WHERE article_oid IS NOT NULL GROUP BY article_oid')
+
+        return WearIndex(outfits, { oid:[worn, last_worn] for oid, worn, last_worn in connection.execute('SELECT oid, worn, last_worn FROM article_wear') })
+
+    def article_removed(self, article: Article, persist=True):
+        # the article's row is kept by the storage, nothing to record here
+        self.removed[str(article.oid)] = article
+
+    def flush(self):
+        # called by SqliteStorage.commit, inside its transaction
+        connection = self.storage.connect()
+
+        if self.rewrite:
+            connection.execute('DELETE FROM outfit_articles')
+            connection.execute('DELETE FROM outfits')
+            connection.execute('DELETE FROM article_wear')
+            connection.execute('DELETE FROM articles WHERE removed = 1')
+            self.rewrite = False
+
+        for record in self.pending:
+            if type(record) == Outfit:
+                self.storage.insert_outfit(connection, record)
+
+        # the transaction takes the rows back if the commit fails, rollback() only has to restore pending
+        self.appended = (None, self.pending)
+        self.pending = []
+
+
+class ArticleColumns():
+
+    # columnar view of a set of articles: one row per article in parallel arrays, with type, subtype
+    # and weather as small integer codes and colors as a bitmask over the color codes
+
+    def __init__(self, articles: List[Article]):
+        self.codes = { 'article_type':{}, 'article_subtype':{}, 'weather':{}, 'color':{} }
+
+        self.oids = []
+        self.article_type = array('H')
+        self.article_subtype = array('H')
+        self.weather = array('Q')       # bitmask, an article can list several weathers
+        self.price = array('d')
+
+        colors = []
+        for article in articles:
+            self.oids.append(article.oid)
+            self.article_type.append(self.code('article_type', article.article_type))
+            self.article_subtype.append(self.code('article_subtype', article.article_subtype))
+            self.weather.append(self.mask('weather', Wardrobe.indexed_values(article)['weather']))
+            self.price.append(float(article.price or 0))
+            colors.append(self.mask('color', article.colors))
+
+        # colors only fit a fixed width column while there are at most 64 of them
+        self.colors = array('Q', colors) if len(self.codes['color']) <= 64 else colors
+
+        self.rows = { oid:row for row, oid in enumerate(self.oids) }
+        self.arrays = None
+
+    def code(self, attribute: str, value: str) -> int:
+        codes = self.codes[attribute]
+        if value not in codes:
+            codes[value] = len(codes)
+        return codes[value]
+
+    def mask(self, attribute: str, values: Iterable[str]) -> int:
+        mask = 0
+        for value in values:
+            mask |= 1 << self.code(attribute, value)
+        return mask
+
+    def lookup_mask(self, attribute: str, values: Iterable[str]) -> int:
+        # like mask(), but values that no article has are ignored instead of getting a code
+        codes = self.codes[attribute]
+        mask = 0
+        for value in values:
+            if value in codes:
+                mask |= 1 << codes[value]
+        return mask
+
+    def __len__(self):
+        return len(self.oids)
+
+    def vectorizable(self) -> bool:
+        return type(self.colors) == array
+
+    def numpy_arrays(self, numpy) -> Dict:
+        # zero-copy numpy views over the columns
+        if self.arrays is None:
+            self.arrays = {
+                'article_type': numpy.frombuffer(self.article_type, dtype=numpy.uint16),
+                'article_subtype': numpy.frombuffer(self.article_subtype, dtype=numpy.uint16),
+                'weather': numpy.frombuffer(self.weather, dtype=numpy.uint64),
+                'colors': numpy.frombuffer(self.colors, dtype=numpy.uint64)
+            }
+        return self.arrays
+
+    def filter_mask(self, numpy, subtypes: Iterable[str] =None, weather: List[str] =None, colors: Iterable[str] =None):
+        # boolean row mask for the criteria that are given, the vectorized counterpart of the index filters
+        arrays = self.numpy_arrays(numpy)
+        mask = numpy.ones(len(self), dtype=bool)
+
+        if subtypes is not None:
+            allowed = numpy.zeros(max(len(self.codes['article_subtype']), 1), dtype=bool)
+            allowed[[ self.codes['article_subtype'][subtype] for subtype in subtypes if subtype in self.codes['article_subtype'] ]] = True
+            mask &= allowed[arrays['article_subtype']]
+
+        if weather is not None:
+            mask &= (arrays['weather'] & numpy.uint64(self.lookup_mask('weather', weather))) != 0
+
+        if colors is not None:
+            mask &= (arrays['colors'] & numpy.uint64(self.lookup_mask('color', colors))) != 0
+
+        return mask
+
 
 class Wardrobe():
+
+    indexed_attributes = ['article_type', 'article_subtype', 'color', 'weather']
     
-    def __init__(self, article_map, json):
+    @timer('wardrobe.build')
+    def __init__(self, article_map, json, history_filepath: str =None):
         
-        self.outfit_history = []
-        if 'outfit_history' in json.keys() and json['outfit_history'] != []:
-            for outfit_data in json['outfit_history']:
-                if outfit_data:
-                    self.outfit_history.append(Outfit.from_json(article_map, outfit_data))
-            json.pop('outfit_history')
+        self.article_map = article_map
+        self.journal = []   # mutation records not yet persisted
+        self.dirty_types = set()    # article types changed since the storage last wrote a snapshot of them
+        self.replaying = False
+
+        outfit_history = json.pop('outfit_history', [])
 
         self.data = { article_type:Wardrobe.parse_articles(articles) for article_type, articles in json.items()}
         
@@ -120,12 +715,59 @@ class Wardrobe():
             if article_type not in self.data.keys():
                 self.data[article_type] = []
 
+        self.articles_by_oid = {}
+        self.positions = {}     # oid -> insertion sequence, keeps index query results in wardrobe order
+        self.next_position = 0
+        self.index = None           # attribute -> value -> oids, built on the first query
+        self.content_index = None   # content key -> oids of articles with those contents, built on the first lookup
+        self.columnar = None        # ArticleColumns, built on demand and dropped on every change
+
+        for articles in self.data.values():
+            for article in articles:
+                if article:
+                    self.index_article(article)
+
+        if STATS:
+            count('articles.loaded', len(self.articles_by_oid))
+
+        # history is only parsed when it is read, entries are resolved against the articles at that point
+        self.outfit_history = OutfitHistory(article_map, self.articles_by_oid, history_filepath, outfit_history)
+
 
     def add_outfit(self, outfit: Outfit):
-        if self.outfit_history:
-            self.outfit_history.append(outfit)
-        else:
-            self.outfit_history = [outfit]
+        self.outfit_history.append(outfit)
+
+    def clear_history(self):
+        self.outfit_history.clear()
+
+    def replay(self, records: List[Dict]):
+        # re-apply persisted journal records, these are already on disk so they are not journaled again.
+        # 'outfit' and 'clear_history' records come from journals written before history had its own file
+        self.replaying = True
+        for record in records:
+            op = record.get('op')
+
+            if op == 'add':
+                # a snapshot written in segments may already have it, if the journal was not removed after it
+                if record['article'].get('oid') not in self.articles_by_oid:
+                    self.add_article(Article.from_json(record['article']))
+            elif op == 'delete':
+                if record['oid'] in self.articles_by_oid:
+                    self.remove_article(self.articles_by_oid[record['oid']])
+            elif op == 'update':
+                if record['oid'] in self.articles_by_oid:
+                    self.update_article(self.articles_by_oid[record['oid']], record.get('weather'), record.get('price'))
+            elif op == 'outfit':
+                self.outfit_history.append_legacy(record['outfit'])
+            elif op == 'clear_history':
+                self.clear_history()
+                self.outfit_history.rewrite = False
+                self.outfit_history.migrate = True
+            else:
+                debug("Unknown journal record", record)
+
+        self.replaying = False
+        self.journal = []
 
     def parse_articles(articles: List[str]) -> List[Article]:
         if type(articles) != type([]):
@@ -141,14 +783,145 @@ class Wardrobe():
 
     def add_article(self, article):
         self.data[article.article_type].append(article)
+        self.dirty_types.add(article.article_type)
+        self.index_article(article)
+        self.journal.append({ 'op':'add', 'article':article.jsonify() })
         return article
 
     def remove_article(self, article):
         if article in self.data[article.article_type]:
             self.data[article.article_type].remove(article)
+            self.dirty_types.add(article.article_type)
+            self.unindex_article(article)
+            self.journal.append({ 'op':'delete', 'oid':str(article.oid) })
+            # history may still reference the article, the history file keeps a copy of it
+            self.outfit_history.article_removed(article, persist=not self.replaying)
         else:
             print("Article not found in '{0}'".format(article.article_type))
 
+    def columns(self) -> ArticleColumns:
+        if self.columnar is None:
+            self.columnar = ArticleColumns(self.articles_for(self.articles_by_oid.keys()))
+        return self.columnar
+
+    def index_article(self, article: Article):
+        oid = str(article.oid)
+        self.columnar = None
+
+        self.articles_by_oid[oid] = article
+        self.positions[oid] = self.next_position
+        self.next_position += 1
+        if self.content_index is not None:
+            self.content_index.setdefault(article.content_key(), []).append(oid)
+        if self.index is not None:
+            self.index_attributes(oid, article)
+
+    def index_attributes(self, oid: str, article: Article):
+        for attribute, values in Wardrobe.indexed_values(article).items():
+            for value in values:
+                self.index[attribute].setdefault(value, set()).add(oid)
+
+    def unindex_article(self, article: Article):
+        oid = str(article.oid)
+        self.columnar = None
+
+        self.articles_by_oid.pop(oid, None)
+        self.positions.pop(oid, None)
+
+        if self.content_index is not None:
+            duplicates = self.content_index.get(article.content_key(), [])
+            if oid in duplicates:
+                duplicates.remove(oid)
+                if not duplicates:
+                    self.content_index.pop(article.content_key())
+
+        if self.index is None:
+            return
+
+        for attribute, values in Wardrobe.indexed_values(article).items():
+            for value in values:
+                oids = self.index[attribute].get(value)
+                if oids is not None:
+                    oids.discard(oid)
+                    if not oids:
+                        self.index[attribute].pop(value)
+
+    def indexed_values(article: Article) -> Dict[str, List[str]]:
+        weather = article.weather if type(article.weather) == type([]) else [article.weather]
+
+        return {
+            'article_type': [article.article_type],
+            'article_subtype': [article.article_subtype],
+            'color': article.colors,
+            'weather': weather
+        }
+
+    def attribute_index(self) -> Dict[str, Dict[str, Set[str]]]:
+        # commands that only list, add or read history never query the index, so it is built on demand
+        if self.index is None:
+            self.index = { attribute:{} for attribute in Wardrobe.indexed_attributes }
+            for oid, article in self.articles_by_oid.items():
+                self.index_attributes(oid, article)
+        return self.index
+
+    def oids_with(self, attribute: str, values: Iterable[str]) -> Set[str]:
+        index = self.attribute_index()[attribute]
+
+        return set().union(*[ index[value] for value in values if value in index ])
+
+    def articles_snapshot(self) -> Dict[str, List[Dict]]:
+        # the articles without history, enough to rebuild an equivalent wardrobe elsewhere
+        return { article_type:[ article.jsonify() for article in articles ] for article_type, articles in self.data.items() }
+
+    def articles_for(self, oids: Set[str]) -> List[Article]:
+        return [ self.articles_by_oid[oid] for oid in sorted(oids, key=self.positions.__getitem__) ]
+
+    def select(self, article_type: str ="", subtypes: List[str] =[], colors: List[str] =[], weather: str ="") -> List[Article]:
+        # each criterion resolves to a set of oids through the index, the query is their intersection
+        selections = []
+
+        if article_type:
+            selections.append(self.oids_with('article_type', [article_type]))
+        if subtypes:
+            selections.append(self.oids_with('article_subtype', subtypes))
+        if colors:
+            selections.append(self.oids_with('color', colors))
+        if weather:
+            selections.append(self.oids_with('weather', [weather, 'any']))
+
+        if not selections:
+            return []
+
+        selections.sort(key=len)
+
+        return self.articles_for(selections[0].intersection(*selections[1:]))
+
+    def update_article(self, article: Article, weather=None, price=None):
+        # only fields outside the content key can change, so the article keeps its identity
+        oid = str(article.oid)
+        position = self.positions[oid]
+
+        self.unindex_article(article)
+        if weather is not None:
+            article.weather = weather
+        if price is not None:
+            article.price = price
+        self.index_article(article)
+        self.positions[oid] = position
+        self.dirty_types.add(article.article_type)
+
+        self.journal.append({ 'op':'update', 'oid':oid, 'weather':article.weather, 'price':article.price })
+
+    def find_by_content(self, content_key: str) -> List[Article]:
+        # content keys are hashes, they are only computed once something is looked up by content
+        if self.content_index is None:
+            self.content_index = {}
+            for article in self.articles_for(self.articles_by_oid.keys()):
+                self.content_index.setdefault(article.content_key(), []).append(str(article.oid))
+
+        # in wardrobe order, an update re-indexes an article but keeps its position
+        return self.articles_for(self.content_index.get(content_key, []))
+
     def list_by_type(self, article_type: str) -> List:
 
         if article_type in self.data.keys():
@@ -161,9 +934,10 @@ class Wardrobe():
         
         if article_type and article_type in self.data.keys():
             if article_subtype:
-                return [ article for article in self.data[article_type] if article.article_subtype == article_subtype ] 
+                return self.select(article_type, [article_subtype])
 
-            return self.data[article_type]
+            # a copy, callers must not be able to change the wardrobe through the result
+            return list(self.data[article_type])
 
         return []
 
@@ -171,34 +945,19 @@ class Wardrobe():
         return self.data[article_type]
 
     def list_by_subtypes(self, article_type: str, subtypes: List[str]) -> List[Article]:
-        articles = self.list_by_type(article_type)
-
-        return [ article for article in articles if article.article_subtype in subtypes]
+        return self.select(article_type, subtypes=subtypes)
 
     def list_by_color(self, article_type: str, colors: List[str]) -> List[Article]:
-        articles = self.list_by_type(article_type)
-
-        selected_articles = [article for article in articles if Wardrobe.article_color_in_colors(article, colors) ]
-
-        return selected_articles
+        return self.select(article_type, colors=colors)
 
     def article_color_in_colors(article: Article, colors: List[str]) -> bool:
-
-        for color in article.colors:
-            if color in colors:
-                return True
-
-        return False
+        return not set(colors).isdisjoint(article.colors)
 
     def list_by_weather(self, article_type: str, weather: str) -> List[Article]:
-        articles = self.list_by_type(article_type)
+        return self.select(article_type, weather=weather)
 
-        selected_articles = [article for article in articles if (weather in article.weather or 'any' in article.weather) ]
 
-        return selected_articles
-
-
-    def dump(self) -> Dict:
+    def dump(self, include_history=False) -> Dict:
         dump = {}
         
         for article_type, articles in self.data.items():
@@ -206,22 +965,644 @@ class Wardrobe():
                 continue
             dump[article_type] = [ article.jsonify() for article in articles if article ]
         
-        dump['outfit_history'] = [ outfit.dump() for outfit in self.outfit_history if outfit ]
+        # history lives in its own file, only self-contained copies carry it inline
+        if include_history:
+            dump['outfit_history'] = [ outfit.dump(self.articles_by_oid) for outfit in self.outfit_history if outfit ]
 
         return dump
         
 
+class StdlibSerializer():
+
+    # the json module, compact output has no whitespace at all
+
+    name = 'json'
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(content, pretty=False) -> bytes:
+        if pretty:
+            return json.dumps(content, indent=2, ensure_ascii=False).encode()
+        return json.dumps(content, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+class OrjsonSerializer():
+
+    # orjson produces the same compact form, several times faster, and parses from a memoryview without copying
+
+    name = 'orjson'
+
+    def loads(data):
+        return ORJSON.loads(data)
+
+    def dumps(content, pretty=False) -> bytes:
+        return ORJSON.dumps(content, option=ORJSON.OPT_INDENT_2 if pretty else 0)
+
+
+class JsonStorage():
+
+    # a wardrobe file holding a json snapshot of the articles. mutations are appended to '<file>.journal'
+    # until they are folded into a new snapshot, outfit history is kept in '<file>.history'
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.journal_filepath = "{0}.journal".format(filepath)
+        self.history_filepath = "{0}.history".format(filepath)
+        self.journal_length = 0     # records in the journal file
+        self.segments = {}          # article type -> its articles as last written, reused while the type is unchanged
+
+    def make_directory(self):
+        # the directory of a new wardrobe (e.g. a user's shard) is only created once there is something to write
+        os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+
+    def load(self) -> Dict:
+        # a missing wardrobe file starts out empty
+        if not os.path.exists(self.filepath):
+            return {}
+
+        with open(self.filepath, 'rb') as wardrobe_data, timed('wardrobe.parse'):
+            return read_json(wardrobe_data)
+
+    def open(self, article_map, data: Dict =None) -> Wardrobe:
+        wardrobe = Wardrobe(article_map, self.load() if data is None else data, self.history_filepath)
+        startup_phase('wardrobe')
+
+        self.journal_length = self.replay_journal(wardrobe)
+        return wardrobe
+
+    def save(self, wardrobe: Wardrobe):
+        # compact, and without history, which is in the history file
+        self.make_directory()
+        wardrobe.outfit_history.flush()
+
+        with timed('wardrobe.write'):
+            self.write_snapshot(wardrobe)
+        wardrobe.dirty_types = set()
+
+        # the snapshot now contains every journaled mutation
+        wardrobe.journal = []
+        self.journal_length = 0
+        if os.path.exists(self.journal_filepath):
+            os.remove(self.journal_filepath)
+
+    def write_snapshot(self, wardrobe: Wardrobe):
+        # the same bytes as serializing wardrobe.dump(), put together from the segments of its types
+        dumps = serializer().dumps
+        atomic_write(self.filepath, b'{' + b','.join( dumps(article_type) + b':' + self.segment(wardrobe, article_type) for article_type, articles in wardrobe.data.items() if articles ) + b'}')
+
+    def segment(self, wardrobe: Wardrobe, article_type: str) -> bytes:
+        if article_type in wardrobe.dirty_types or article_type not in self.segments:
+            self.segments[article_type] = serializer().dumps([ article.jsonify() for article in wardrobe.data[article_type] if article ])
+            if STATS:
+                count('segments.serialized')
+                count('articles.saved', len(wardrobe.data[article_type]))
+
+        return self.segments[article_type]
+
+    def export(self, wardrobe: Wardrobe, pretty=False):
+        # a self-contained copy, history included inline
+        atomic_write(self.filepath, serializer().dumps(wardrobe.dump(True), pretty))
+
+    def commit(self, wardrobe: Wardrobe, compact=True):
+        # persist pending mutations, read-only transactions leave the files untouched
+        records = wardrobe.journal
+        history = wardrobe.outfit_history
+
+        if not records and not history.dirty():
+            return
+
+        # history is written first, a wardrobe file that still has it inline is rewritten without it.
+        # if the rest fails, the history records are taken back, so no part of a failed commit is left on disk
+        self.make_directory()
+        migrating = history.migrate
+        history.appended = None
+
+        try:
+            history.flush()
+
+            if migrating:
+                self.save(wardrobe)
+            elif records and (not JOURNAL or (compact and self.journal_length + len(records) >= JOURNAL_COMPACT_THRESHOLD)):
+                debug("compacting journal into", self.filepath)
+                self.save(wardrobe)
+            elif records:
+                self.append_journal(wardrobe)
+        except Exception:
+            history.rollback()
+            raise
+
+        history.appended = None
+
+    def append_journal(self, wardrobe: Wardrobe):
+        records = wardrobe.journal
+
+        if STATS:
+            count('journal.records', len(records))
+
+        dumps = serializer().dumps
+        journal_bytes = os.path.getsize(self.journal_filepath) if os.path.exists(self.journal_filepath) else 0
+        try:
+            with open(self.journal_filepath, 'ab') as journal:
+                journal.write(b''.join( dumps(record)+b'\n' for record in records ))
+                journal.flush()
+                os.fsync(journal.fileno())
+        except Exception:
+            # records that did reach the file would be replayed on the next start
+            if os.path.exists(self.journal_filepath):
+                truncate(self.journal_filepath, journal_bytes)
+            raise
+
+        self.journal_length += len(records)
+        wardrobe.journal = []
+
+    def compact(self, wardrobe: Wardrobe):
+        if self.journal_length >= JOURNAL_COMPACT_THRESHOLD:
+            self.save(wardrobe)
+
+    def replay_journal(self, wardrobe: Wardrobe) -> int:
+        if not os.path.exists(self.journal_filepath):
+            return 0
+
+        loads = serializer().loads
+        records = []
+        with open(self.journal_filepath, 'rb') as journal:
+            for line_number, line in enumerate(journal, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(loads(line))
+                except json.JSONDecodeError as jsonde:
+                    # a crash during an append can only leave a partial last record
+                    print("Ignoring corrupt journal record at {0}:{1}".format(self.journal_filepath, line_number))
+                    debug(jsonde)
+
+        wardrobe.replay(records)
+
+        return len(records)
+
+
+class SegmentedStorage(JsonStorage):
+
+    # a wardrobe directory with one compact json file per article type, beside its journal and history files,
+    # and 'types' listing the types in wardrobe order (seeded generation draws them in that order).
+    # the files are read as they are and kept as the types' segments, a snapshot only rewrites the files of changed types
+
+    extensions = ('.d',)
+
+    def __init__(self, filepath: str):
+        JsonStorage.__init__(self, filepath)
+        self.journal_filepath = os.path.join(filepath, 'journal')
+        self.history_filepath = os.path.join(filepath, 'history')
+        self.types_filepath = os.path.join(filepath, 'types')
+        self.types = []     # the article types as last written to 'types'
+
+    def make_directory(self):
+        # journal and history live inside the wardrobe directory
+        os.makedirs(self.filepath, exist_ok=True)
+
+    def segment_filepath(self, article_type: str) -> str:
+        return os.path.join(self.filepath, "{0}.json".format(article_type))
+
+    def load(self) -> Dict:
+        if not os.path.isdir(self.filepath):
+            return {}
+
+        loads = serializer().loads
+        data = {}
+
+        if os.path.exists(self.types_filepath):
+            with open(self.types_filepath, 'rb') as types_file:
+                self.types = loads(types_file.read())
+
+        with timed('wardrobe.parse'):
+            for filename in sorted(os.listdir(self.filepath)):
+                if not filename.endswith('.json'):
+                    continue
+                with open(os.path.join(self.filepath, filename), 'rb') as segment_file:
+                    segment = segment_file.read()
+                data[filename[:-len('.json')]] = loads(segment)
+                self.segments[filename[:-len('.json')]] = segment
+
+        ordered = { article_type:data.pop(article_type) for article_type in self.types if article_type in data }
+        ordered.update(data)
+        return ordered
+
+    def write_snapshot(self, wardrobe: Wardrobe):
+        # the journal is only removed once every segment is written, a replay skips articles a segment already has
+        os.makedirs(self.filepath, exist_ok=True)
+
+        for article_type in wardrobe.data.keys():
+            if article_type in wardrobe.dirty_types or article_type not in self.segments:
+                atomic_write(self.segment_filepath(article_type), self.segment(wardrobe, article_type))
+
+        if self.types != list(wardrobe.data.keys()):
+            self.types = list(wardrobe.data.keys())
+            atomic_write(self.types_filepath, serializer().dumps(self.types))
+
+    def export(self, wardrobe: Wardrobe, pretty=False):
+        # a complete copy, with the history in its own file
+        dumps = serializer().dumps
+        os.makedirs(self.filepath, exist_ok=True)
+
+        for article_type, articles in wardrobe.data.items():
+            atomic_write(self.segment_filepath(article_type), dumps([ article.jsonify() for article in articles if article ], pretty))
+        atomic_write(self.types_filepath, dumps(list(wardrobe.data.keys())))
+        atomic_write(self.history_filepath, b''.join( dumps(outfit.dump(wardrobe.articles_by_oid))+b'\n' for outfit in wardrobe.outfit_history ))
+
+        if os.path.exists(self.journal_filepath):
+            os.remove(self.journal_filepath)
+
+
+class SqliteStorage():
+
+    # a wardrobe in a SQLite database: a row per article with its type and subtype indexed, and indexed
+    # color and weather rows beside it; history is a row per outfit joined to its articles.
+    # a commit turns the wardrobe's pending mutation records into changes to just those rows, in one transaction
+
+    extensions = ('.db', '.sqlite', '.sqlite3')
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS articles (
+            oid TEXT PRIMARY KEY,
+            position INTEGER,
+            article_type TEXT NOT NULL,
+            article_subtype TEXT NOT NULL,
+            description TEXT NOT NULL,
+            weather TEXT NOT NULL,
+            price,
+            colors TEXT NOT NULL,
+            removed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS articles_by_type ON articles (article_type, article_subtype);
+        CREATE INDEX IF NOT EXISTS articles_by_position ON articles (position);
+        CREATE TABLE IF NOT EXISTS article_colors ( oid TEXT NOT NULL, color TEXT NOT NULL );
+        CREATE INDEX IF NOT EXISTS article_colors_by_color ON article_colors (color);
+        CREATE INDEX IF NOT EXISTS article_colors_by_oid ON article_colors (oid);
+        CREATE TABLE IF NOT EXISTS article_weather ( oid TEXT NOT NULL, weather TEXT NOT NULL );
+        CREATE INDEX IF NOT EXISTS article_weather_by_weather ON article_weather (weather);
+        CREATE INDEX IF NOT EXISTS article_weather_by_oid ON article_weather (oid);
+        CREATE TABLE IF NOT EXISTS outfits (
+            oid TEXT PRIMARY KEY,
+            sequence INTEGER NOT NULL UNIQUE,
+            seed INTEGER,
+            criteria TEXT
+        );
+        CREATE TABLE IF NOT EXISTS outfit_articles (
+            outfit_oid TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            article_type TEXT NOT NULL,
+            article_oid TEXT,
+            PRIMARY KEY (outfit_oid, slot)
+        );
+        CREATE INDEX IF NOT EXISTS outfit_articles_by_article ON outfit_articles (article_oid);
+        CREATE TABLE IF NOT EXISTS article_wear (
+            oid TEXT PRIMARY KEY,
+            worn INTEGER NOT NULL,
+            last_worn INTEGER NOT NULL
+        );
+    '''
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            import sqlite3
+
+            # connecting creates the database, and the directory of a new one (e.g. a user's shard).
+            # commits may run on a worker thread (e.g. the HTTP API's), callers never use it concurrently
+            os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+            self.connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            self.connection.executescript(SqliteStorage.schema)
+
+        return self.connection
+
+    def select_articles(self, condition: str ='removed = 0', parameters: Tuple =()) -> List[Dict]:
+        # article json for the rows matching the condition, in wardrobe order
+        rows = self.connect().execute('SELECT oid, article_type, article_subtype, description, weather, price, colors FROM articles WHERE {0} ORDER BY position'.format(condition), parameters)
+
+        return [ {
+            'oid': oid,
+            'article_type': article_type,
+            'article_subtype': article_subtype,
+            'description': description,
+            'weather': json.loads(weather),
+            'price': price,
+            'colors': json.loads(colors)
+        } for oid, article_type, article_subtype, description, weather, price, colors in rows ]
+
+    def load(self, article_type: str ="", subtypes: List[str] =[], colors: List[str] =[], weather: str ="") -> Dict:
+        # the wardrobe's articles by type, or only those matching the criteria (as Wardrobe.select matches them)
+        conditions = ['removed = 0']
+        parameters = []
+
+        if article_type:
+            conditions.append('article_type = ?')
+            parameters.append(article_type)
+        if subtypes:
+            conditions.append('article_subtype IN ({0})'.format(','.join('?' * len(subtypes))))
+            parameters += subtypes
+        if colors:
+            conditions.append('oid IN (SELECT oid FROM article_colors WHERE color IN ({0}))'.format(','.join('?' * len(colors))))
+            parameters += colors
+        if weather:
+            conditions.append("oid IN (SELECT oid FROM article_weather WHERE weather IN (?, 'any'))")
+            parameters.append(weather)
+
+        data = {}
+        with timed('wardrobe.query'):
+            for article in self.select_articles(' AND '.join(conditions), tuple(parameters)):
+                data.setdefault(article['article_type'], []).append(article)
+
+        return data
+
+    def open(self, article_map, data: Dict =None) -> Wardrobe:
+        wardrobe = Wardrobe(article_map, self.load() if data is None else data)
+        wardrobe.outfit_history = SqliteOutfitHistory(self, article_map, wardrobe.articles_by_oid)
+        startup_phase('wardrobe')
+
+        return wardrobe
+
+    def write_article(self, connection, article: Article, removed=0):
+        oid = str(article.oid)
+        weather = article.weather if type(article.weather) == type([]) else [article.weather]
+
+        # a re-added article goes to the end of the wardrobe, like it does in memory
+        connection.execute('INSERT OR REPLACE INTO articles VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM articles), ?, ?, ?, ?, ?, ?, ?)',
+                           (oid, article.article_type, article.article_subtype, article.description, json.dumps(article.weather), article.price, json.dumps(list(article.colors)), removed))
+        self.write_attributes(connection, oid, 'article_colors', article.colors if not removed else [])
+        self.write_attributes(connection, oid, 'article_weather', weather if not removed else [])
+
+    def write_attributes(self, connection, oid: str, table: str, values: Iterable[str]):
+        connection.execute('DELETE FROM {0} WHERE oid = ?'.format(table), (oid,))
+        connection.executemany('INSERT INTO {0} VALUES (?, ?)'.format(table), [ (oid, value) for value in values ])
+
+    def apply(self, connection, record: Dict):
+        op = record.get('op')
+
+        if op == 'add':
+            self.write_article(connection, Article.from_json(record['article']))
+        elif op == 'delete':
+            # outfits in the history may still reference the article, it is only marked removed then
+            connection.execute('DELETE FROM articles WHERE oid = ? AND NOT EXISTS (SELECT 1 FROM outfit_articles WHERE article_oid = ?)', (record['oid'], record['oid']))
+            connection.execute('UPDATE articles SET removed = 1 WHERE oid = ?', (record['oid'],))
+            self.write_attributes(connection, record['oid'], 'article_colors', [])
+            self.write_attributes(connection, record['oid'], 'article_weather', [])
+        elif op == 'update':
+            weather = record['weather'] if type(record['weather']) == type([]) else [record['weather']]
+            connection.execute('UPDATE articles SET weather = ?, price = ? WHERE oid = ?', (json.dumps(record['weather']), record['price'], record['oid']))
+            self.write_attributes(connection, record['oid'], 'article_weather', weather)
+        else:
+            debug("Unknown mutation record", record)
+
+    def insert_outfit(self, connection, outfit: Outfit):
+        oid = str(outfit.oid)
+        connection.execute('INSERT OR REPLACE INTO outfits VALUES (?, (SELECT COALESCE(MAX(sequence), -1) + 1 FROM outfits), ?, ?)',
+                           (oid, outfit.seed, json.dumps(outfit.criteria) if outfit.criteria is not None else None))
+
+        # outfits are numbered from 1 in the wear index
+        number = connection.execute('SELECT sequence + 1 FROM outfits WHERE oid = ?', (oid,)).fetchone()[0]
+
+        # a type the outfit has nothing of keeps a slot without an article
+        slots = [ (article_type, article) for article_type, articles in outfit.articles.items() for article in articles or [None] ]
+        for slot, (article_type, article) in enumerate(slots):
+            connection.execute('INSERT OR REPLACE INTO outfit_articles VALUES (?, ?, ?, ?)', (oid, slot, article_type, str(article.oid) if article else None))
+            if article is None:
+                continue
+
+            connection.execute('INSERT INTO article_wear VALUES (?, 1, ?) ON CONFLICT (oid) DO UPDATE SET worn = worn + 1, last_worn = excluded.last_worn', (str(article.oid), number))
+
+            # an article removed before the outfit was stored still needs a row to resolve from,
+            # one added in the same commit replaces it with its live row
+            if not connection.execute('SELECT 1 FROM articles WHERE oid = ?', (str(article.oid),)).fetchone():
+                self.write_article(connection, article, removed=1)
+
+    def commit(self, wardrobe: Wardrobe, compact=True):
+        records = wardrobe.journal
+        history = wardrobe.outfit_history
+
+        if not records and not history.dirty():
+            return
+
+        if STATS:
+            count('sqlite.records', len(records))
+
+        # history first, so removals see the outfits that still reference an article
+        connection = self.connect()
+        history.appended = None
+        try:
+            with connection, timed('sqlite.transaction'):
+                history.flush()
+                for record in records:
+                    self.apply(connection, record)
+        except Exception:
+            history.rollback()
+            raise
+
+        history.appended = None
+        wardrobe.journal = []
+
+    def save(self, wardrobe: Wardrobe):
+        # the rows are the snapshot
+        self.commit(wardrobe)
+
+    def compact(self, wardrobe: Wardrobe):
+        pass
+
+    def export(self, wardrobe: Wardrobe, pretty=False):
+        # replaces the database's contents with the wardrobe, history included
+        connection = self.connect()
+        with connection:
+            for table in ('outfit_articles', 'outfits', 'article_wear', 'article_colors', 'article_weather', 'articles'):
+                connection.execute('DELETE FROM {0}'.format(table))
+
+            for article in wardrobe.articles_for(wardrobe.articles_by_oid.keys()):
+                self.write_article(connection, article)
+
+            for outfit in wardrobe.outfit_history:
+                self.insert_outfit(connection, outfit)
+
+
+class FixedData():
+
+    # compiled form of fixed.json: membership tests are on frozensets and colors are interned
+    # as small integer ids so compatibility can be checked with bitmasks
+
+    cache_version = 3   # bump when the compiled attributes change so stale caches are rebuilt
+
+    def __init__(self, fixed_data: Dict):
+        self.raw = fixed_data
+        self.article_map = fixed_data['article_types']
+        self.weather = fixed_data['weather']
+
+        self.subtypes = { article_type:frozenset(subtypes) for article_type, subtypes in self.article_map.items() }
+        self.uses = { use:frozenset(subtypes) for use, subtypes in fixed_data['uses'].items() }
+        self.palettes = { palette:frozenset(colors) for palette, colors in fixed_data['palettes'].items() }
+        self.compatibility = { color:frozenset(compatibles) for color, compatibles in fixed_data['compatibility'].items() }
+
+        # a palette criterion always accepts the neutral colors as well
+        neutral_colors = self.palettes.get('neutral', frozenset())
+        self.palette_colors = { palette:colors | neutral_colors for palette, colors in self.palettes.items() }
+
+        colors = set(self.compatibility.keys())
+        for compatibles in self.compatibility.values():
+            colors.update(compatibles)
+        for palette_colors in self.palettes.values():
+            colors.update(palette_colors)
+
+        self.color_ids = { sys.intern(color):color_id for color_id, color in enumerate(sorted(colors)) }
+        # a color always goes with itself, even when fixed.json does not list it
+        self.compatibility_masks = { color:self.colors_mask(compatibles | {color}) for color, compatibles in self.compatibility.items() }
+        self.all_colors_mask = (1 << len(self.color_ids)) - 1
+
+    def colors_mask(self, colors: Iterable[str]) -> int:
+        mask = 0
+        for color in colors:
+            if color in self.color_ids:
+                mask |= 1 << self.color_ids[color]
+        return mask
+
+    def color_signature(self, colors: List[str]) -> Tuple[int, int]:
+        # (colors the article has, colors it is compatible with), colorless articles go with anything
+        colors_mask = self.colors_mask(colors)
+
+        if not colors_mask:
+            return self.all_colors_mask, self.all_colors_mask
+
+        compatible_mask = 0
+        for color in colors:
+            compatible_mask |= self.compatibility_masks.get(color, 0)
+
+        return colors_mask, compatible_mask
+
+    def compatibility_matrix(self, numpy):
+        # color x color compatibility as a matrix over the color ids, a color is always compatible with itself
+        if getattr(self, 'compatibility_array', None) is None:
+            matrix = numpy.identity(len(self.color_ids))
+            for color, compatibles in self.compatibility.items():
+                for compatible in compatibles:
+                    if compatible in self.color_ids:
+                        matrix[self.color_ids[color], self.color_ids[compatible]] = 1.0
+            self.compatibility_array = matrix
+
+        return self.compatibility_array
+
+    def pair_score(self, colors: List[str], other_colors: List[str]) -> float:
+        # share of color pairings between two articles that are compatible
+        if not colors or not other_colors:
+            return 1.0
+
+        compatible = sum( 1 for color in colors for other_color in other_colors if other_color == color or other_color in self.compatibility.get(color, ()) )
+
+        return compatible / (len(colors) * len(other_colors))
+
+    def outfit_score(self, articles: List) -> float:
+        pairs = [ (article, other) for i, article in enumerate(articles) for other in articles[i+1:] ]
+
+        if not pairs:
+            return 1.0
+
+        return round(sum( self.pair_score(article.colors, other.colors) for article, other in pairs ) / len(pairs), 9)
+
+    def outfit_score_numpy(self, numpy, articles: List) -> float:
+        # same score as outfit_score, with all pairings counted at once: A @ M @ A.T, where A holds
+        # each article's color counts and M is the compatibility matrix
+        if len(articles) < 2:
+            return 1.0
+
+        if any( color not in self.color_ids for article in articles for color in article.colors ):
+            return self.outfit_score(articles)
+
+        counts = numpy.zeros((len(articles), len(self.color_ids)))
+        for row, article in enumerate(articles):
+            numpy.add.at(counts[row], [ self.color_ids[color] for color in article.colors ], 1)
+
+        compatible = counts @ self.compatibility_matrix(numpy) @ counts.T
+        sizes = counts.sum(axis=1)
+        pairings = numpy.outer(sizes, sizes)
+
+        # colorless articles go with anything
+        pair_scores = numpy.divide(compatible, pairings, out=numpy.ones_like(compatible), where=pairings > 0)
+        upper = numpy.triu_indices(len(articles), 1)
+
+        return round(float(pair_scores[upper].mean()), 9)
+
+    def from_compiled(compiled: Dict):
+        fixed = FixedData.__new__(FixedData)
+        fixed.__dict__.update(compiled)
+        return fixed
+
+    def cache_filepath(fixed_data_filename: str) -> str:
+        directory, filename = os.path.split(fixed_data_filename)
+        return os.path.join(directory, ".{0}.cache".format(filename))
+
+    def load(fixed_data_filename: str):
+        # the compiled model is cached next to the source file, keyed on a checksum of its contents.
+        # marshal and zlib are built in, a cache hit costs no imports
+        import marshal, zlib
+
+        with open(fixed_data_filename, 'rb') as fixed_file:
+            raw = fixed_file.read()
+
+        digest = "{0:08x}:{1}".format(zlib.crc32(raw), len(raw))
+        cache_filepath = FixedData.cache_filepath(fixed_data_filename)
+
+        if os.path.exists(cache_filepath):
+            try:
+                with open(cache_filepath, 'rb') as cache_file:
+                    cached = marshal.load(cache_file)
+                if cached.get('digest') == digest and cached.get('version') == FixedData.cache_version:
+                    return FixedData.from_compiled(cached['compiled'])
+            except Exception as e:
+                debug("Ignoring unreadable fixed data cache", e)
+
+        fixed = FixedData(WardrobeGenerator.enforce_consistency( serializer().loads(raw), fixed_data_filename ))
+
+        # key the cache on what is on disk now, enforce_consistency may have written fixes back
+        with open(fixed_data_filename, 'rb') as fixed_file:
+            raw = fixed_file.read()
+        digest = "{0:08x}:{1}".format(zlib.crc32(raw), len(raw))
+
+        try:
+            atomic_write(cache_filepath, marshal.dumps({ 'digest':digest, 'version':FixedData.cache_version, 'compiled':fixed.__dict__ }))
+        except (OSError, ValueError) as e:
+            debug("Could not write fixed data cache", e)
+
+        return fixed
+
+
 class WardrobeGenerator():
 
-    cli_modes = ['add','list','delete','generate','import','history','help','last']
+    weather_values = frozenset(['hot','cold','normal','all','wet','any'])
+
+    # how many articles of a type go into one outfit, (min, max); types not listed get exactly one
+    article_counts = { 'accessory':(1, 4) }
+
+    cli_modes = ['add','list','delete','generate','catalogue','import','export','history','help','last','validate','daemon','convert','stats']
 
     def __init__(self, fixed_data_filename, wardrobe_data_filename="", is_cli=False):
         self.load_fixed_data(fixed_data_filename)
         self.is_cli = is_cli
+        startup_phase('fixed data')
+
+        # a json wardrobe file that cannot be read is picked interactively
+        data = self.load_wardrobe_data(wardrobe_data_filename) if type(storage_for(wardrobe_data_filename)) == JsonStorage else None
+        self.open_wardrobe(wardrobe_data_filename, data)
 
-        self.wardrobe = Wardrobe(self.article_map, self.load_wardrobe_data(wardrobe_data_filename))
+    def open_wardrobe(self, wardrobe_data_filename: str, data: Dict =None):
         self.filepath = wardrobe_data_filename
+        self.storage = storage_for(wardrobe_data_filename)
 
+        if data is None:
+            data = self.storage.load()
+        startup_phase('wardrobe file')
+
+        self.wardrobe = self.storage.open(self.article_map, data)
+        startup_phase('journal')
+
+    @timer('save')
     def save(self, save_filepath=None, pretty=False ):
         if not save_filepath:
             save_filepath = self.filepath
@@ -229,23 +1610,20 @@ class WardrobeGenerator():
         if not self.is_cli:
             print("saving changes to {0}".format(save_filepath))
 
-        with open(save_filepath,'w') as f:
-            if pretty:
-                f.write( json.dumps(self.wardrobe.dump(), indent=4))
-            else:
-                f.write(json.dumps(self.wardrobe.dump()))
+        # copies elsewhere are self-contained, in whichever format their name asks for
+        if save_filepath == self.filepath:
+            self.storage.save(self.wardrobe)
+        else:
+            storage_for(save_filepath).export(self.wardrobe, pretty)
+
+    @timer('commit')
+    def commit(self, compact=True):
+        # persist pending mutations, read-only transactions leave the files untouched
+        self.storage.commit(self.wardrobe, compact)
     
     def load_fixed_data(self, fixed_data_filename):
         try:
-            fixed_data = json.load( open(fixed_data_filename) )
-            
-            self.fixed_data = WardrobeGenerator.enforce_consistency( fixed_data )
-            self.palettes = self.fixed_data['palettes']
-            self.color_map = self.fixed_data['compatibility']
-            self.article_map = self.fixed_data['article_types']
-            self.weather = self.fixed_data['weather']
-            self.uses = self.fixed_data['uses']
-
+            self.use_fixed_data(FixedData.load(fixed_data_filename))
 
         except json.JSONDecodeError as jsonde:
             print("Failed to load application data.")
@@ -253,6 +1631,35 @@ class WardrobeGenerator():
             sys.exit(1)
 
 
+    def use_fixed_data(self, fixed: FixedData):
+        self.fixed = fixed
+
+        self.fixed_data = self.fixed.raw
+        self.palettes = self.fixed.palettes
+        self.color_map = self.fixed.compatibility
+        self.article_map = self.fixed.article_map
+        self.weather = self.fixed.weather
+        self.uses = self.fixed.uses
+
+    def from_loaded(fixed: FixedData, wardrobe: Wardrobe):
+        # an in-memory generator without backing files, e.g. inside a worker process
+        generator = WardrobeGenerator.__new__(WardrobeGenerator)
+        generator.use_fixed_data(fixed)
+        generator.is_cli = True
+        generator.wardrobe = wardrobe
+        generator.filepath = None
+        generator.storage = None
+        return generator
+
+    def from_file(fixed: FixedData, wardrobe_data_filename: str):
+        # a generator over an already compiled fixed data model, a missing wardrobe file starts out empty
+        generator = WardrobeGenerator.__new__(WardrobeGenerator)
+        generator.use_fixed_data(fixed)
+        generator.is_cli = True
+
+        generator.open_wardrobe(wardrobe_data_filename)
+        return generator
+
     def load_wardrobe_data(self, wardrobe_data_filename: str) -> str:
         cwd = os.getcwd()
         fp = "{0}/{1}".format(cwd, wardrobe_data_filename)
@@ -260,8 +1667,8 @@ class WardrobeGenerator():
         
         if self.is_cli and os.path.exists(fp):
             try:
-                with open(wardrobe_data_filename) as wardrobe_data:
-                    data = json.load(open(wardrobe_data_filename))
+                with open(wardrobe_data_filename, 'rb') as wardrobe_data, timed('wardrobe.parse'):
+                    data = read_json(wardrobe_data)
                 return data
             except Exception as e:
                 debug(e)
@@ -280,8 +1687,8 @@ class WardrobeGenerator():
                 wardrobe_data_filename = robust_str_entry("No wardrobe file found [{0}] | Enter filename\n\t>".format(fp))
             if os.path.exists(fp):
                 try:
-                    with open(wardrobe_data_filename) as wardrobe_data:
-                        data = json.load(open(wardrobe_data_filename))
+                    with open(wardrobe_data_filename, 'rb') as wardrobe_data, timed('wardrobe.parse'):
+                        data = read_json(wardrobe_data)
                     return data
                 except Exception as e:
                     debug(e)
@@ -289,20 +1696,85 @@ class WardrobeGenerator():
                     wardrobe_data_filename = "---"
 
 
-    def enforce_consistency( fixed_data ):
+    def find_discrepancies( fixed_data ) -> List[Tuple[str, str]]:
+        # compatibility must be symmetric: every (color, comp) pair here is missing its (comp, color) counterpart
+        compatibility = fixed_data['compatibility']
 
-        for color, compatibles in fixed_data['compatibility'].items():
-            for comp in compatibles:
-                #debug(color, compatibles, '\n\t',comp, fixed_data['compatibility'][comp])
-                if color not in fixed_data['compatibility'][comp]:
-                    print("Fixing Discrepancy: ", comp,":",color,"|",color,":",comp)
-                    fixed_data['compatibility'][comp].append(color)
+        return [ (color, comp) for color, compatibles in compatibility.items() for comp in compatibles if color not in compatibility.get(comp, []) ]
+
+    @timer('fixed.consistency')
+    def enforce_consistency( fixed_data, fixed_data_filename='fixed.json' ):
+
+        discrepancies = WardrobeGenerator.find_discrepancies( fixed_data )
+
+        for color, comp in discrepancies:
+            print("Fixing Discrepancy: ", comp,":",color,"|",color,":",comp)
+            compatibles = fixed_data['compatibility'].setdefault(comp, [])
+            if color not in compatibles:
+                compatibles.append(color)
+
+        # only rewrite the file when something was actually fixed
+        if discrepancies:
+            atomic_write(fixed_data_filename, json.dumps( fixed_data, indent=4 ))
 
-        output = open('fixed.json','w')
-        output.write( json.dumps( fixed_data, indent=4 ) )
-        output.close()
         return fixed_data
 
+    def handle_validate_cli(args):
+        debug('handle_validate_cli({0})'.format(','.join(args)))
+
+        fixed_data_filename = args[0] if args else 'fixed.json'
+
+        try:
+            with open(fixed_data_filename, 'rb') as fixed_file:
+                fixed_data = read_json(fixed_file)
+        except (OSError, json.JSONDecodeError) as e:
+            print("Failed to load {0}: {1}".format(fixed_data_filename, e))
+            sys.exit(1)
+
+        discrepancies = WardrobeGenerator.find_discrepancies( fixed_data )
+
+        for color, comp in discrepancies:
+            print("Discrepancy: ", color,":",comp,"| missing",comp,":",color)
+
+        print("{0} discrepancies found in {1}".format(len(discrepancies), fixed_data_filename))
+
+        if discrepancies:
+            sys.exit(1)
+
+    def handle_convert_cli(args):
+        debug('handle_convert_cli({0})'.format(','.join(args)))
+
+        if len(args) != 2:
+            print('Convert Help:\n\t<from> <to> : copies a wardrobe and its history between json files, segmented wardrobe directories (.d) and SQLite databases (.db, .sqlite, .sqlite3)')
+            return
+
+        if not os.path.exists(args[0]):
+            print("No wardrobe file {0}".format(args[0]))
+            sys.exit(1)
+
+        fixed = FixedData.load('fixed.json')
+        wardrobe = storage_for(args[0]).open(fixed.article_map)
+        storage_for(args[1]).export(wardrobe)
+
+        print("Converted {0} articles and {1} outfits from {2} to {3}".format(len(wardrobe.articles_by_oid), len(wardrobe.outfit_history), args[0], args[1]))
+
+    def handle_stats_cli(args):
+        debug('handle_stats_cli({0})'.format(','.join(args)))
+
+        # a single call reports its own stats with --stats, this asks the daemon for everything it collected
+        if any( arg not in ('json', 'reset') for arg in args ):
+            print('Stats Help:\n\t(no option): timers and counters collected by the running daemon\n\tjson : as json\n\treset : clear them once reported')
+            return
+
+        response = WardrobeDaemon.request(WardrobeDaemon.socket_path_for(WARDROBE), { 'control':'stats', 'json':'json' in args, 'reset':'reset' in args })
+        if response is None:
+            print("No daemon is running, pass --stats to report on a single call")
+            sys.exit(1)
+
+        print(response['output'], end='')
+        if response['status']:
+            sys.exit(response['status'])
+
     def handle_add_cli(self, args):
         debug('handle_add_cli({0})'.format(','.join(args)))
         
@@ -318,7 +1790,7 @@ class WardrobeGenerator():
 
         else:
             article_type, article_subtype, description, colors, temp, price = self.parse_article_cli_args(args)
-            article = self.wardrobe.add_article(Article(article_type, article_subtype, description, colors, temp, price))
+            article = self.wardrobe.add_article(Article(None, article_type, article_subtype, description, colors, temp, price))
 
 
     def handle_delete_cli(self, args):
@@ -386,94 +1858,510 @@ class WardrobeGenerator():
 
         if len(args) == 0:
             print('Generate Help:'+
-                '\n\tRandom\n\tPalette: [{0}]\n\tWeather: [{1}]\n\tUse: [{2}]'
-                .format( '|'.join(list(self.palettes.keys())), '|'.join(self.weather), '|'.join(self.uses)))
+                '\n\tRandom\n\tPalette: [{0}]\n\tWeather: [{1}]\n\tUse: [{2}]\n\tEngine: [random|compatible|fresh]\n\tTop: <#> (compatible engine)'
+                .format( '|'.join(list(self.palettes.keys())), '|'.join(self.weather), '|'.join(self.uses))+
+                '\n\tCount: <#> (unique outfits in one call)\n\tSeed: <#> (reproducible generation)\n\t<type>_count: <min>-<max> (e.g. accessory_count:1-4)')
 
         elif len(args) >= 1:
 
             criteria = {}
 
-            for criterium in args:
-                category, selection = criterium.split(':')
-                criteria[category] = selection
+            try:
+                for criterium in args:
+                    if ':' not in criterium:
+                        raise ValueError("options are <category>:<selection>, not '{0}'".format(criterium))
+                    category, selection = criterium.split(':', 1)
+                    criteria[category] = selection
+
+                self.counts_for(criteria)
+                if 'top' in criteria and (not criteria['top'].isdecimal() or int(criteria['top']) < 1):
+                    raise ValueError("top takes a number of outfits, not '{0}'".format(criteria['top']))
+                if 'count' in criteria:
+                    if not criteria['count'].isdecimal():
+                        raise ValueError("count takes a number of outfits, not '{0}'".format(criteria['count']))
+                    WardrobeGenerator.check_outfit_count(int(criteria['count']))
+                if 'seed' in criteria and not criteria['seed'].isdecimal():
+                    raise ValueError("seed takes a number, not '{0}'".format(criteria['seed']))
+            except ValueError as ve:
+                print("Invalid option: {0}".format(ve))
+                return
+
+            # every outfit gets a seed, so it can be regenerated later from its history entry
+            seed = int(criteria['seed']) if 'seed' in criteria else new_seed()
+
+            if 'count' in criteria:
+                outfits = self.generate_many(criteria, int(criteria['count']), seed=seed)
+
+                for fit in outfits:
+                    print(fit)
+                    print('')
+                    self.wardrobe.add_outfit(fit)
+
+                print("Generated {0} outfits".format(len(outfits)))
+                return
+
+            if criteria.get('engine') == 'compatible':
+                import random
+                ranked = self.generate_compatible(criteria, int(criteria.get('top', 1)), rng=random.Random(seed))
+
+                if not ranked:
+                    print("No outfit with compatible colors found")
+                    return
+
+                # the best outfit is the one added to the history
+                fit = Outfit(None, self.article_map, ranked[0][1], seed, WardrobeGenerator.generation_criteria(criteria))
+                print("#1 (score {0:.2f})\n{1}".format(ranked[0][0], fit))
+                self.wardrobe.add_outfit(fit)
 
-            articles = self.generate_by_criteria(criteria)
+                for rank, (score, ranked_articles) in enumerate(ranked[1:], 2):
+                    print("\n#{0} (score {1:.2f})\n{2}".format(rank, score, Outfit(None, self.article_map, ranked_articles)))
+
+                return fit
+
+            articles = self.generate_by_criteria(criteria, seed=seed)
 
         if articles:
-            fit = Outfit(uuid.uuid4(), self.article_map, articles)
+            fit = Outfit(None, self.article_map, articles, seed, WardrobeGenerator.generation_criteria(criteria))
             print(fit)
             self.wardrobe.add_outfit(fit)
             return fit
 
 
-    def generate_by_criteria(self, criteria={}):
-        debug('generate_by_criteria ->',criteria)
+    def numpy_backend(self):
+        # the numpy module when the vectorized backend should be used, otherwise None
+        global NUMPY
 
-        articles = { available_type:[] for available_type in self.wardrobe.data.keys()}
+        if BACKEND == 'python' or (BACKEND == 'auto' and len(self.wardrobe.articles_by_oid) < COLUMNAR_MIN_ARTICLES):
+            return None
+
+        if NUMPY is None:
+            try:
+                import numpy
+                NUMPY = numpy
+            except ImportError:
+                debug("numpy is not installed, using the python backend")
+                NUMPY = False
+
+        return NUMPY or None
+
+    def score_outfit(self, articles: List[Article]) -> float:
+        numpy = self.numpy_backend()
+
+        if numpy is not None:
+            return self.fixed.outfit_score_numpy(numpy, articles)
+
+        return self.fixed.outfit_score(articles)
+
+    @timer('generate.filter')
+    def candidate_pools(self, criteria={}) -> Dict[str, Tuple[Article, ...]]:
+
+        numpy = self.numpy_backend()
+        if numpy is not None and self.wardrobe.columns().vectorizable():
+            return self.candidate_pools_numpy(numpy, criteria)
+
+        pools = {}
 
         for available_type in self.wardrobe.data.keys():
 
-            available_articles = self.wardrobe.list_by(available_type)
+            candidates = self.wardrobe.oids_with('article_type', [available_type])
 
-            if available_articles:  
+            if candidates:  
+                if STATS:
+                    count('filter.scanned', len(candidates))
 
                 # filter by uses
-                available_articles = self.filter_by_use(criteria, available_articles)
+                candidates = self.filter_by_use(criteria, candidates)
+                if STATS:
+                    count('filter.use.kept', len(candidates))
 
                 # filter by weather
-                available_articles = self.filter_by_weather(criteria, available_articles)
+                candidates = self.filter_by_weather(criteria, candidates)
+                if STATS:
+                    count('filter.weather.kept', len(candidates))
 
                 # filter by color palette
-                available_articles = self.filter_by_color_palette(criteria, available_articles)
+                candidates = self.filter_by_color_palette(criteria, candidates)
+                if STATS:
+                    count('filter.color.kept', len(candidates))
+
+            # pools are immutable so they can be shared between draws
+            pools[available_type] = tuple(self.wardrobe.articles_for(candidates))
+
+        return pools
+
+    def candidate_pools_numpy(self, numpy, criteria={}) -> Dict[str, Tuple[Article, ...]]:
+        # same pools as candidate_pools, filtered with boolean masks over the columnar wardrobe
+        columns = self.wardrobe.columns()
+
+        mask = columns.filter_mask(numpy,
+            subtypes=self.uses[criteria['use']] if 'use' in criteria else None,
+            weather=[criteria['weather'], 'any'] if 'weather' in criteria else None,
+            colors=self.fixed.palette_colors[criteria['color']] if 'color' in criteria else None)
+
+        article_types = columns.numpy_arrays(numpy)['article_type']
+        lookup = self.wardrobe.articles_by_oid
+        pools = {}
+
+        if STATS:
+            count('filter.scanned', len(columns))
+            count('filter.numpy.kept', int(mask.sum()))
+
+        for available_type in self.wardrobe.data.keys():
+            code = columns.codes['article_type'].get(available_type)
+
+            if code is None:
+                pools[available_type] = ()
+                continue
+
+            # columns are in wardrobe order, so the pools come out in the same order as the index path
+            rows = numpy.flatnonzero(mask & (article_types == code))
+            pools[available_type] = tuple( lookup[columns.oids[row]] for row in rows.tolist() )
 
-                if available_articles:
+        return pools
 
-                    if available_type == 'accessory':      # provide multiple options for accessories
+    def handle_catalogue_cli(self, args):
+        debug('handle_catalogue_cli({0})'.format(','.join(args)))
 
-                        num_accessories = random.randrange(1,5)
+        if len(args) == 0:
+            print('Catalogue Help: generates outfits for every use x weather x palette combination'+
+                '\n\tCount: <#> (outfits per combination)\n\tWorkers: <#> (processes, defaults to cpu count)\n\tSeed: <#>\n\tEngine: [random|compatible]\n\tOut: <filename> (json)')
+            return
 
-                        for i in range(num_accessories):
-                            random_article = random.choice(available_articles)
-                            available_articles.remove(random_article)
-                            articles[available_type].append(random_article)
+        try:
+            options = {}
+            for option in args:
+                if ':' not in option:
+                    raise ValueError("options are <name>:<value>, not '{0}'".format(option))
+                name, value = option.split(':', 1)
+                options[name] = value
+
+            for name in ('count', 'workers', 'seed'):
+                if name in options and not options[name].isdecimal():
+                    raise ValueError("{0} takes a number, not '{1}'".format(name, options[name]))
+            if options.get('workers') == '0':
+                raise ValueError("workers takes at least 1 process")
+            if options.get('engine', 'random') not in ('random', 'compatible'):
+                raise ValueError("engine takes random or compatible, not '{0}'".format(options['engine']))
+            WardrobeGenerator.check_outfit_count(int(options.get('count', 1)))
+        except ValueError as ve:
+            print("Invalid option: {0}".format(ve))
+            return
+
+        start = time.perf_counter()
+        catalogue = self.generate_catalogue(int(options.get('count', 1)), workers=int(options['workers']) if 'workers' in options else None,
+                                            seed=int(options.get('seed', 0)), engine=options.get('engine', 'random'))
+        elapsed = time.perf_counter() - start
+
+        for criteria, outfits in catalogue:
+            print("{0:20} {1:6} {2:16} | {3} outfits".format(criteria['use'], criteria['weather'], criteria['color'], len(outfits)))
+
+        print("Generated {0} outfits for {1} combinations in {2:.2f}s".format(sum(len(outfits) for criteria, outfits in catalogue), len(catalogue), elapsed))
+
+        if 'out' in options:
+            atomic_write(options['out'], serializer().dumps([ { 'criteria':criteria, 'outfits':[ outfit.dump(self.wardrobe.articles_by_oid) for outfit in outfits ] } for criteria, outfits in catalogue ]))
+            print("Catalogue written to {0}".format(options['out']))
+
+    def generation_criteria(criteria: Dict[str, str]) -> Dict[str, str]:
+        # the criteria recorded with an outfit, without the per-call options
+        return { category:selection for category, selection in criteria.items() if category not in ('seed', 'count') }
+
+    @timer('generate.single')
+    def generate_by_criteria(self, criteria={}, rng=None, seed=None):
+        debug('generate_by_criteria ->',criteria)
+        import random
+
+        if seed is not None:
+            rng = random.Random(seed)
+        elif rng is None:
+            rng = random
+
+        pools = self.candidate_pools(criteria)
+        return self.draw_outfit(pools, rng, self.counts_for(criteria), self.recency_weights(criteria, pools))
+
+    def recency_weights(self, criteria: Dict[str, str], pools: Dict[str, Tuple[Article, ...]]) -> Dict[str, Tuple[float, ...]]:
+        # with 'engine:fresh', each pool article's draw weight from the wear index; a lookup per article, however long the history
+        if criteria.get('engine') != 'fresh':
+            return None
+
+        with timed('generate.weights'):
+            wear = self.wardrobe.outfit_history.wear_index()
+            return { available_type:tuple( wear.weight(article.oid) for article in available_articles ) for available_type, available_articles in pools.items() }
+
+    def counts_for(self, criteria={}) -> Dict[str, Tuple[int, int]]:
+        # per-type counts can be overridden with '<type>_count:<min>-<max>' or '<type>_count:<n>'
+        counts = dict(self.article_counts)
+
+        for category, selection in criteria.items():
+            if category.endswith('_count'):
+                bounds = selection.split('-', 1)
+                if not all( bound.isdecimal() for bound in bounds ) or int(bounds[0]) > int(bounds[-1]):
+                    raise ValueError("{0} takes <min>-<max> or <n>, with 0 <= min <= max, not '{1}'".format(category, selection))
+                counts[category[:-len('_count')]] = (int(bounds[0]), int(bounds[-1]))
+
+        return counts
+
+    def regenerate(self, outfit: Outfit) -> Dict[str, List[Article]]:
+        # replays the generation an outfit was created with, against the current wardrobe.
+        # None without a seed, or when a compatible search no longer finds as many outfits as it ranked
+        if outfit.seed is None:
+            return None
+
+        criteria = outfit.criteria or {}
+
+        if criteria.get('engine') == 'compatible':
+            import random
+            ranked = self.generate_compatible(criteria, int(criteria.get('top', 1)), rng=random.Random(outfit.seed))
+            rank = int(criteria.get('rank', 0))
+            return ranked[rank][1] if rank < len(ranked) else None
+
+        return self.generate_by_criteria(criteria, seed=outfit.seed)
+
+    def draw_outfit(self, pools: Dict[str, Tuple[Article, ...]], rng=None, counts=None, weights=None) -> Dict[str, List[Article]]:
+        # pools are only read, so the same pools can be reused for many draws.
+        # weights, if given, hold a draw weight for each article of each pool
+        if rng is None:
+            import random
+            rng = random
+
+        counts = self.article_counts if counts is None else counts
+        articles = { available_type:[] for available_type in self.wardrobe.data.keys()}
 
+        for available_type, available_articles in pools.items():
+
+            if available_articles:
+
+                if counts.get(available_type, (1, 1)) != (1, 1):      # provide multiple options, e.g. accessories
+
+                    # sampling without replacement costs O(k) in the number picked, not the pool size
+                    num_articles = rng.randint(*counts[available_type])
+
+                    if weights:
+                        # weighted sampling without replacement: the k largest random keys u^(1/weight)
+                        import heapq
+                        type_weights = weights[available_type]
+                        picked = heapq.nlargest(min(num_articles, len(available_articles)), range(len(available_articles)), key=lambda index: rng.random() ** (1.0 / type_weights[index]))
+                        articles[available_type].extend( available_articles[index] for index in picked )
                     else:
-                        random_article = random.choice(available_articles)
-                        articles[available_type].append(random_article)
+                        articles[available_type].extend(rng.sample(available_articles, min(num_articles, len(available_articles))))
+
+                elif weights:
+                    articles[available_type].append(rng.choices(available_articles, weights[available_type])[0])
+
+                else:
+                    random_article = rng.choice(available_articles)
+                    articles[available_type].append(random_article)
 
         return articles
 
-    def filter_by_use(self, criteria, articles):
+    @timer('generate.many')
+    def generate_many(self, criteria={}, n=1, unique=True, seed=None) -> List[Outfit]:
+        # filters run once, every draw reuses the same candidate pools
+        debug('generate_many ->',criteria, n, unique, seed)
+        import random
+
+        WardrobeGenerator.check_outfit_count(n)
+
+        seed = new_seed() if seed is None else seed
+        recorded = WardrobeGenerator.generation_criteria(criteria)
+
+        if criteria.get('engine') == 'compatible':
+            recorded['top'] = str(n)
+            ranked = self.generate_compatible(criteria, n, rng=random.Random(seed))
+            return [ Outfit(None, self.article_map, articles, seed, dict(recorded, rank=str(rank))) for rank, (score, articles) in enumerate(ranked) ]
+
+        pools = self.candidate_pools(criteria)
+        counts = self.counts_for(criteria)
+        weights = self.recency_weights(criteria, pools)
+
+        outfits = []
+        seen = set()
+        attempts = 0
+
+        # small wardrobes may not have n distinct outfits, give up after a bounded number of repeats
+        while len(outfits) < n and attempts < n * 10:
+            # each draw has its own seed so every outfit can be regenerated on its own. the first draw uses the
+            # seed as given, so one outfit comes out the same as 'generate seed:S' and records the seed it was asked for
+            draw_seed = seed if attempts == 0 else derive_seed(seed, attempts)
+            attempts += 1
+            articles = self.draw_outfit(pools, random.Random(draw_seed), counts, weights)
+
+            if not any(articles.values()):
+                break
+
+            if unique:
+                key = Outfit.key(articles)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            outfits.append(Outfit(None, self.article_map, articles, draw_seed, recorded))
+
+        return outfits
+
+    def check_outfit_count(n: int):
+        # generation time grows with n, a request for more than MAX_OUTFITS outfits is refused rather than served
+        if not 1 <= n <= MAX_OUTFITS:
+            raise ValueError("count takes 1 to {0} outfits, not {1}".format(MAX_OUTFITS, n))
+
+    def generate_compatible(self, criteria={}, k=1, budget=GENERATION_BUDGET, rng=None) -> List[Tuple[float, Dict[str, List[Article]]]]:
+        # backtracking search for outfits where every pair of articles has compatible colors,
+        # returns up to k outfits ranked by score, best first. the budget counts color checks rather than
+        # seconds, so the same rng seed always finds the same outfits (catalogues, history replay)
+        debug('generate_compatible ->',criteria, k, budget)
+        import heapq
+
+        if rng is None:
+            import random
+            rng = random
+
+        pools = self.candidate_pools(criteria)
+        counts = self.counts_for(criteria)
+        signatures = { str(article.oid):self.fixed.color_signature(article.colors) for pool in pools.values() for article in pool }
+
+        # types with exactly one article are searched, the others (accessories) are added to each solution
+        core_types = [ article_type for article_type, pool in pools.items() if pool and counts.get(article_type, (1, 1)) == (1, 1) ]
+        extra_types = [ article_type for article_type, pool in pools.items() if pool and article_type not in core_types ]
+
+        checks = [0]     # color checks made so far, across every restart
+        max_solutions = max(k * 10, 20)
+        solutions = []
+        seen = set()
+
+        def compatible(article, chosen_masks):
+            colors_mask = signatures[str(article.oid)][0]
+            return all( compatible_mask & colors_mask for compatible_mask in chosen_masks )
+
+        def spent() -> bool:
+            return checks[0] >= budget
+
+        def search(domains, chosen, chosen_masks) -> bool:
+            # depth first until one outfit is found, returns False once the budget is spent
+            if spent():
+                return False
+
+            if not domains:
+                key = Outfit.key({ article_type:[article] for article_type, article in chosen.items() })
+                if key not in seen:
+                    seen.add(key)
+                    solutions.append(dict(chosen))
+                    return True
+                return False
+
+            # most constrained type first
+            article_type = min(domains, key=lambda t: len(domains[t]))
+            remaining = { t:domain for t, domain in domains.items() if t != article_type }
+
+            for article in domains[article_type]:
+                compatible_mask = signatures[str(article.oid)][1]
+
+                # forward check: drop candidates of the remaining types that clash with this article
+                pruned = { t:[ candidate for candidate in domain if compatible_mask & signatures[str(candidate.oid)][0] ] for t, domain in remaining.items() }
+                checks[0] += sum( len(domain) for domain in remaining.values() )
+
+                if all(pruned.values()):
+                    chosen[article_type] = article
+                    found = search(pruned, chosen, chosen_masks + [compatible_mask])
+                    chosen.pop(article_type)
+
+                    if found:
+                        return True
+
+                if spent():
+                    return False
+
+            return False
+
+        # restart from freshly shuffled domains for every outfit so the ranked outfits are not near-duplicates
+        attempts = 0
+        while len(solutions) < max_solutions and attempts < max_solutions * 2 and not spent():
+            attempts += 1
+            domains = { article_type:rng.sample(pools[article_type], len(pools[article_type])) for article_type in core_types }
+
+            if not search(domains, {}, []) and not solutions and not spent():
+                break   # the whole space was searched without finding any compatible outfit
+
+        ranked = []
+
+        for sequence, solution in enumerate(solutions):
+            articles = { available_type:[] for available_type in self.wardrobe.data.keys() }
+
+            for article_type, article in solution.items():
+                articles[article_type].append(article)
+
+            # accessories are added afterwards, each must go with everything already chosen
+            chosen_masks = [ signatures[str(article.oid)][1] for article in solution.values() ]
+
+            for article_type in extra_types:
+                num_articles = rng.randint(*counts[article_type])
+
+                for article in rng.sample(pools[article_type], len(pools[article_type])):
+                    if len(articles[article_type]) >= num_articles:
+                        break
+                    if compatible(article, chosen_masks):
+                        articles[article_type].append(article)
+                        chosen_masks.append(signatures[str(article.oid)][1])
+
+            score = self.score_outfit([ article for selected in articles.values() for article in selected ])
+            heapq.heappush(ranked, (-score, sequence, articles))
+
+        debug('generate_compatible found {0} outfits'.format(len(solutions)))
+
+        return [ (-score, articles) for score, sequence, articles in heapq.nsmallest(k, ranked) ]
+
+    def criteria_combinations(self) -> List[Dict[str, str]]:
+        return [ { 'use':use, 'weather':weather, 'color':palette } for use, weather, palette in itertools.product(self.uses, self.weather, self.palettes) ]
+
+    def generate_catalogue(self, n=1, combinations=None, workers=None, seed=0, engine='random') -> List[Tuple[Dict[str, str], List[Outfit]]]:
+        # generates n outfits for every criteria combination, fanned out over a process pool;
+        # each combination draws from its own seeded rng so results do not depend on scheduling
+        WardrobeGenerator.check_outfit_count(n)
+        combinations = combinations if combinations is not None else self.criteria_combinations()
+
+        tasks = [ (dict(criteria, engine=engine), n, derive_seed(seed, index)) for index, criteria in enumerate(combinations) ]
+        snapshot = (self.fixed.__dict__, self.wardrobe.articles_snapshot())
+
+        if workers == 1:
+            catalogue_worker_init(*snapshot)
+            results = [ catalogue_worker_task(task) for task in tasks ]
+        else:
+            import concurrent.futures
+
+            # the wardrobe is shipped once per worker through the initializer, tasks only carry criteria and a seed
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=catalogue_worker_init, initargs=snapshot) as executor:
+                chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+                results = list(executor.map(catalogue_worker_task, tasks, chunksize=chunksize))
+
+        return [ (criteria, [ Outfit.from_json(self.article_map, outfit, self.wardrobe.articles_by_oid) for outfit in outfits ]) for criteria, outfits in zip(combinations, results) ]
+
+    # filters narrow a set of candidate oids by intersecting it with the wardrobe index
+
+    def filter_by_use(self, criteria, candidates: Set[str]) -> Set[str]:
 
         if 'use' in criteria.keys():
 
-            return [ article for article in articles if article.article_subtype in self.uses[criteria['use']] ]
+            return candidates & self.wardrobe.oids_with('article_subtype', self.uses[criteria['use']])
 
         else: # if not filtering by use, keep items
-            return articles
+            return candidates
 
-    def filter_by_weather(self, criteria, articles):
+    def filter_by_weather(self, criteria, candidates: Set[str]) -> Set[str]:
         
         if 'weather' in criteria.keys():
 
-            return [ article for article in articles if ('any' in article.weather or criteria['weather'] in article.weather) ]
+            return candidates & self.wardrobe.oids_with('weather', [criteria['weather'], 'any'])
 
         else:  # if not filtering by weather, keep items
-            return articles
+            return candidates
 
 
-    def filter_by_color_palette(self, criteria, articles):
+    def filter_by_color_palette(self, criteria, candidates: Set[str]) -> Set[str]:
         
         if 'color' in criteria.keys():
 
-            colors_for_palette = self.palettes[criteria['color']]
-            neutral_colors = self.palettes['neutral']
-            colors_for_palette += neutral_colors
-
-            return [ article for article in articles if Wardrobe.article_color_in_colors(article, colors_for_palette)]
+            return candidates & self.wardrobe.oids_with('color', self.fixed.palette_colors[criteria['color']])
 
         else:  # if not filtering by weather, keep items
-            return articles
+            return candidates
 
 
     def handle_last_cli(self, args):
@@ -487,76 +2375,187 @@ class WardrobeGenerator():
 
         if args:
             if args[0] == 'clear':
-                self.wardrobe.outfit_history = []
+                self.wardrobe.clear_history()
                 print('cleared')
                 return
 
+            if args[0].startswith('replay:'):
+                self.replay_outfit(args[0].split(':', 1)[1])
+                return
+
+            if args[0].startswith('last:'):
+                last = args[0].split(':', 1)[1]
+                if not last.isdecimal():
+                    print("Invalid option: last takes a number of outfits, not '{0}'".format(last))
+                    print('History Help:\n\tlast:<#> (most recent outfits)\n\treplay:<outfit oid prefix>\n\tworn\n\tclear')
+                    return
+
+                for fit in self.wardrobe.outfit_history.last(int(last)):
+                    print(fit)
+                    print('')
+                return
+
+            if args[0] == 'worn':
+                self.print_wear()
+                return
+
         for fit in self.wardrobe.outfit_history:
             print(fit)
             print('')
 
 
+    def print_wear(self):
+        # wear counts from the index. articles no longer in the wardrobe are resolved from the outfits that wore them
+        # (removal records and legacy embedded copies), the history is only loaded when there are such articles
+        history = self.wardrobe.outfit_history
+        wear = history.wear_index()
+        lookup = dict(history.removed, **self.wardrobe.articles_by_oid)
+
+        if any( oid not in lookup for oid in wear.worn ):
+            for fit in history:
+                for articles in fit.articles.values():
+                    for article in articles:
+                        lookup.setdefault(str(article.oid), article)
+
+        for oid, worn, since in wear.most_worn():
+            article = lookup.get(oid)
+            print("{0:4}x  {1}  (last worn {2} outfits ago)".format(worn, article.summary() if article else "{0} (not in the wardrobe)".format(oid), since))
+
+        print("{0} articles worn in {1} outfits".format(len(wear.worn), wear.outfits))
+
+    def replay_outfit(self, oid_prefix: str):
+        matches = [ fit for fit in self.wardrobe.outfit_history if str(fit.oid).startswith(oid_prefix) ]
+
+        if len(matches) != 1:
+            print("{0} outfits match '{1}'".format(len(matches), oid_prefix))
+            return
+
+        fit = matches[0]
+
+        if fit.seed is None:
+            print("Outfit [{0}] has no recorded seed".format(fit.oid))
+            return
+
+        articles = self.regenerate(fit)
+
+        if articles is None:
+            print("Outfit [{0}] could not be reproduced, the search found fewer outfits than its rank (the wardrobe changed since)".format(fit.oid))
+            return
+
+        print(Outfit(fit.oid, self.article_map, articles, fit.seed, fit.criteria))
+        print('')
+        print("matches history" if Outfit.key(articles) == Outfit.key(fit.articles) else "differs from history (the wardrobe, or for engine:fresh what was worn, changed since)")
+
     def handle_import_cli(self, args):
         debug('handle_import_cli({0})'.format(','.join(args)))
 
         if len(args) == 0:
             print('Import Help:'+
-                '\n\tFilename: str')
+                '\n\tFilename: str ("-" reads from stdin)')
 
         else:
             wardrobe_data_filename = args[0]
 
-            imported = 0
+            if wardrobe_data_filename == '-':
+                self.import_articles(sys.stdin)
 
-            cwd = os.getcwd()
-            fp = "{0}/{1}".format(cwd, wardrobe_data_filename)
+            elif os.path.exists(wardrobe_data_filename):
+                with open(wardrobe_data_filename) as import_data:
+                    self.import_articles(import_data)
 
-            if os.path.exists(fp):
+            else:
+                print("No file found at [{0}]".format(os.path.abspath(wardrobe_data_filename)))
+                print('Imported 0 articles')
 
-                import_data = open(fp).readlines()
+    def handle_export_cli(self, args):
+        debug('handle_export_cli({0})'.format(','.join(args)))
 
-                for line in import_data:
-                    line = line.strip()
+        if len(args) != 1:
+            print('Export Help:'+
+                '\n\tFilename: str (indented json with the history inline; a segmented directory for .d, a SQLite database for .db, .sqlite and .sqlite3)')
+            return
 
-                    if line == "" or line.startswith('#'):
-                        continue
+        if os.path.abspath(args[0]) == os.path.abspath(self.filepath):
+            print("{0} is the wardrobe itself".format(args[0]))
+            return
 
-                    multipart_token = ""
-                    tokens = []
-                    for t in line.split(' '):
+        self.save(args[0], pretty=PRETTY)
+        print('Exported {0} articles to {1}'.format(len(self.wardrobe.articles_by_oid), args[0]))
 
-                        if t.startswith('"') and t.endswith('"'):
-                            tokens.append(t.replace('"',''))
-                            continue
-                        elif t.startswith('"'):
-                            t = t.replace('"','')
-                        elif t.endswith('"'):
-                            multipart_token += t.replace('"','')
-                            tokens.append(multipart_token)
-                            multipart_token = ""
-                            continue
-                        elif multipart_token == '':
-                            tokens.append(t)
-                            continue
+    # quoted descriptions or single whitespace separated words
+    import_token = re.compile(r'"([^"]*)"|(\S+)')
 
-                        multipart_token += "{0} ".format(t)
+    def import_articles(self, lines: Iterable[str], batch_size=IMPORT_BATCH_SIZE) -> Tuple[int, List[Tuple[int, str, str]]]:
+        # lines are parsed as they are read and committed in batches, so the input is never held in memory.
+        # articles are upserted by content: the n-th line with given contents matches the n-th such article
+        # already in the wardrobe, so re-importing the same file adds nothing while genuine duplicates are kept
+        imported = 0
+        updated = 0
+        unchanged = 0
+        rejected = []
+        occurrences = {}
 
-                    article_type, article_subtype, description, colors, temp, price = self.parse_article_cli_args(tokens)
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
 
-                    new_article = Article(article_type, article_subtype, description, colors, temp, price)
+            if line == "" or line.startswith('#'):
+                continue
+
+            article, reason = self.parse_import_line(line)
+
+            if not article:
+                rejected.append((line_number, reason, line))
+                print("Rejected line {0}: {1} | {2}".format(line_number, reason, line))
+                continue
 
-                    imported += 1
-                    debug('Importing new article: ', new_article.summary())
+            content_key = article.content_key()
+            occurrence = occurrences.get(content_key, 0)
+            occurrences[content_key] = occurrence + 1
 
-                    self.wardrobe.add_article( new_article )
+            existing = self.wardrobe.find_by_content(content_key)
 
+            if occurrence < len(existing):
+                current = existing[occurrence]
+
+                if (current.weather, current.price) == (article.weather, article.price):
+                    unchanged += 1
+                    continue
+
+                debug('Updating article: ', current.summary())
+                self.wardrobe.update_article( current, article.weather, article.price )
+                updated += 1
 
             else:
-                print("No file found at [{0}]".format(fp))
+                debug('Importing new article: ', article.summary())
+                self.wardrobe.add_article( article )
+                imported += 1
 
-            print('Imported {0} articles'.format(imported))
-            
+            if len(self.wardrobe.journal) >= batch_size:
+                self.commit(compact=False)
+
+        self.commit(compact=False)
+
+        # fold the journal into a snapshot once, rather than after every batch
+        self.storage.compact(self.wardrobe)
+
+        print('Imported {0} articles ({1} updated, {2} unchanged)'.format(imported, updated, unchanged))
+        if rejected:
+            print('Rejected {0} lines'.format(len(rejected)))
+
+        return imported, rejected
+
+    def parse_import_line(self, line: str) -> Tuple[Article, str]:
+        tokens = [ match.group(match.lastindex) for match in WardrobeGenerator.import_token.finditer(line) ]
+
+        article_type, article_subtype, description, colors, temp, price = self.parse_article_cli_args(tokens)
+
+        if not article_type:
+            return None, "unknown article type"
+
+        if not article_subtype:
+            return None, "unknown subtype for '{0}'".format(article_type)
 
+        return Article(None, article_type, article_subtype, description, colors, temp, price), ""
 
 
     def parse_article_cli_args(self, args):
@@ -567,17 +2566,17 @@ class WardrobeGenerator():
             arg = arg.strip().lower()
 
             # article type
-            if arg in self.article_map.keys():
+            if arg in self.article_map:
                 article_type = arg
 
             # article subtype
-            elif article_type and arg in self.article_map[article_type]:
+            elif article_type and arg in self.fixed.subtypes[article_type]:
                 article_subtype = arg
 
-            elif arg in self.color_map.keys():
+            elif arg in self.color_map:
                 colors.append(arg)
 
-            elif arg in ['hot','cold','normal','all','wet','any']:
+            elif arg in WardrobeGenerator.weather_values:
                 temp = arg
 
             elif '$' in arg:
@@ -599,25 +2598,29 @@ class WardrobeGenerator():
         return
 
     def help_cli(*args):
-        print(f""" ### Wardrobe Generator CLI ### \n\t### usages ###\n{'\n'.join(WardrobeGenerator.cli_modes)}""")
+        usages = '\n'.join(WardrobeGenerator.cli_modes)
+        print(f""" ### Wardrobe Generator CLI ### \n\t### usages ###\n{usages}""")
 
 
-    def handle_cli_transaction(self, args):
+    def handle_cli_transaction(self, args, commit=True):
 
         cli_nav = {
             'add':self.handle_add_cli,
             'list':self.handle_list_cli,
             'delete':self.handle_delete_cli,
-            'search':self.handle_search_cli,
             'generate':self.handle_generate_cli,
+            'catalogue':self.handle_catalogue_cli,
             'import':self.handle_import_cli,
+            'export':self.handle_export_cli,
             'history':self.handle_history_cli,
             'help':WardrobeGenerator.help_cli,
             'last':self.handle_last_cli
         }
 
         print('')
-        cli_nav[args[1]](args[2:])
+        with timed("cli.{0}".format(args[1])):
+            cli_nav[args[1]](args[2:])
+        startup_phase(args[1])
 
         '''
         try:
@@ -628,8 +2631,322 @@ class WardrobeGenerator():
         '''
         print('')
 
-        self.save(pretty=PRETTY)
+        # the daemon commits on its own schedule
+        if commit:
+            self.commit()
+            startup_phase('commit')
+
+
+class WardrobeTenancy():
+
+    # many users' wardrobes in one process: the compiled fixed data is shared by all of them, each user has
+    # their own wardrobe file (with its own journal and history), and only the most recently used are kept loaded
+
+    user_id_pattern = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}')
+
+    def __init__(self, fixed: FixedData, directory: str =TENANT_DIRECTORY, capacity: int =TENANT_CACHE_SIZE):
+        import collections
+
+        self.fixed = fixed
+        self.directory = directory
+        self.capacity = capacity
+        self.generators = collections.OrderedDict()     # user id -> WardrobeGenerator, least recently used first
+
+    def filepath_for(user_id: str, directory: str =TENANT_DIRECTORY) -> str:
+        # files are spread over 256 shard directories so none of them grows to thousands of entries
+        import hashlib
+
+        if not WardrobeTenancy.user_id_pattern.fullmatch(user_id):
+            raise ValueError("invalid user id '{0}'".format(user_id))
+
+        shard = hashlib.sha1(user_id.encode()).hexdigest()[:2]
+        return os.path.join(directory, shard, "{0}{1}".format(user_id, os.path.splitext(WARDROBE)[1] or '.json'))
+
+    def generator_for(self, user_id: str) -> WardrobeGenerator:
+        if user_id in self.generators:
+            self.generators.move_to_end(user_id)
+            return self.generators[user_id]
+
+        filepath = WardrobeTenancy.filepath_for(user_id, self.directory)
+
+        # room is made first, a wardrobe that fails to commit on eviction leaves the cache as it was
+        while self.generators and len(self.generators) >= self.capacity:
+            self.evict()
+
+        # the shard directory is created by the storage once there is something to write
+        generator = WardrobeGenerator.from_file(self.fixed, filepath)
+        self.generators[user_id] = generator
+
+        return generator
+
+    def wardrobe_for(self, user_id: str) -> Wardrobe:
+        return self.generator_for(user_id).wardrobe
+
+    def evict(self):
+        # pending changes are committed before the wardrobe is dropped, it stays loaded if that fails
+        user_id, generator = next(iter(self.generators.items()))
+        debug("evicting wardrobe of", user_id)
+        generator.commit()
+        del self.generators[user_id]
+
+    def commit(self):
+        for generator in self.generators.values():
+            generator.commit()
+
+    def close(self):
+        while self.generators:
+            self.evict()
+
+    def __len__(self):
+        return len(self.generators)
+
+
+class WardrobeDaemon():
+
+    # keeps a WardrobeGenerator loaded and serves CLI calls over a unix socket, one json object per line:
+    #   request  {"argv": ["generate", "weather:cold"], "stdin": ""}  or  {"control": "stop"|"status"}
+    #   response {"output": "...", "status": 0}
+    # with "stream_stdin": true, the request is followed by the client's stdin until it shuts down its side of the socket,
+    # so 'import -' reads its lines as they arrive instead of as one json string.
+    # requests are handled one at a time, mutations are committed at most every flush_interval seconds.
+    # a request with a "user" works on that user's wardrobe, loaded through a WardrobeTenancy
+
+    def __init__(self, generator: WardrobeGenerator, socket_path: str, flush_interval: float =DAEMON_FLUSH_INTERVAL):
+        self.generator = generator
+        self.socket_path = socket_path
+        self.flush_interval = flush_interval
+        self.running = False
+        self.requests = 0
+        self.tenants = WardrobeTenancy(generator.fixed)
+
+    def socket_path_for(wardrobe_data_filename: str) -> str:
+        return "{0}.sock".format(wardrobe_data_filename)
+
+    def serve(self):
+        import socket, signal
+
+        if os.path.exists(self.socket_path):
+            if WardrobeDaemon.request(self.socket_path, { 'control':'status' }) is not None:
+                print("A daemon is already serving {0}".format(self.socket_path))
+                return
+            os.remove(self.socket_path)     # left behind by a daemon that did not shut down cleanly
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        server.settimeout(self.flush_interval)
+
+        self.running = True
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        print("Serving {0} on {1}".format(self.generator.filepath, self.socket_path))
+
+        next_flush = time.monotonic() + self.flush_interval
+        try:
+            while self.running:
+                try:
+                    connection, address = server.accept()
+                except socket.timeout:
+                    connection = None
+
+                if connection is not None:
+                    self.answer(connection)
+
+                if time.monotonic() >= next_flush:
+                    # changes stay pending after a failed flush, the next one retries them
+                    try:
+                        self.generator.commit()
+                        self.tenants.commit()
+                    except Exception as e:
+                        print("Failed to commit changes: {0!r}".format(e))
+                    next_flush = time.monotonic() + self.flush_interval
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.generator.commit()
+            self.tenants.close()
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            print("Stopped after {0} requests".format(self.requests))
+
+    def answer(self, connection):
+        # one request per connection. a client that sends garbage, stalls or goes away only loses its own request
+        import io
+        connection.settimeout(DAEMON_CLIENT_TIMEOUT)
+
+        try:
+            with connection, connection.makefile('rwb') as stream:
+                line = stream.readline()
+                if not line:
+                    return
+
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+
+                if type(request) != type({}):
+                    response = { 'output':"Malformed daemon request\n", 'status':2 }
+                else:
+                    stdin = io.TextIOWrapper(stream, encoding='utf-8') if request.get('stream_stdin') else None
+                    try:
+                        response = self.handle(request, stdin)
+                    except Exception as e:
+                        response = { 'output':"Failed to handle daemon request: {0!r}\n".format(e), 'status':1 }
+                    finally:
+                        # the response is written to the stream itself, which closing the wrapper would close
+                        if stdin is not None:
+                            stdin.detach()
+
+                stream.write((json.dumps(response)+'\n').encode())
+                stream.flush()
+        except OSError as e:
+            # timeouts, broken pipes and resets
+            debug("Dropped daemon connection", e)
+
+    def stop(self):
+        self.running = False
+
+    def handle(self, request: Dict, stdin=None) -> Dict:
+        # stdin, a text file, is what the command reads from stdin; otherwise the request's "stdin" string
+        import io, contextlib, traceback
+
+        control = request.get('control')
+        if control == 'stop':
+            self.stop()
+            return { 'output':"stopping\n", 'status':0 }
+        if control == 'status':
+            pending = len(self.generator.wardrobe.journal) + len(self.generator.wardrobe.outfit_history.pending)
+            return { 'output':"serving {0} and {1} loaded user wardrobes, {2} requests, {3} uncommitted records\n".format(self.generator.filepath, len(self.tenants), self.requests, pending), 'status':0 }
+        if control == 'stats':
+            if not STATS:
+                return { 'output':"The daemon is not collecting stats, start it with --stats or WARDROBE_STATS=1\n", 'status':1 }
+            output = json.dumps(stats_snapshot())+'\n' if request.get('json') else format_stats()
+            if request.get('reset'):
+                reset_stats()
+            return { 'output':output, 'status':0 }
+
+        argv = request.get('argv') or []
+        if not is_cli_transaction(['wardrobe.py'] + argv) or argv[0] in ('daemon', 'validate', 'convert', 'stats'):
+            return { 'output':"Unsupported daemon request {0}\n".format(argv), 'status':2 }
+
+        if request.get('user') and not (type(request['user']) == type('') and WardrobeTenancy.user_id_pattern.fullmatch(request['user'])):
+            return { 'output':"Invalid user id {0!r}\n".format(request['user']), 'status':2 }
+
+        self.requests += 1
+        output = io.StringIO()
+        status = 0
+        daemon_stdin = sys.stdin
+
+        try:
+            sys.stdin = stdin if stdin is not None else io.StringIO(request.get('stdin') or '')
+            generator = self.tenants.generator_for(request['user']) if request.get('user') else self.generator
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                generator.handle_cli_transaction(['wardrobe.py'] + argv, commit=False)
+        except SystemExit as se:
+            status = se.code if type(se.code) == int else 1
+        except Exception:
+            traceback.print_exc(file=output)
+            status = 1
+        finally:
+            sys.stdin = daemon_stdin
+
+        return { 'output':output.getvalue(), 'status':status }
+
+    def request(socket_path: str, request: Dict, stdin=None, timeout: float =DAEMON_REQUEST_TIMEOUT):
+        # the daemon's response, or None when no daemon is listening on socket_path. stdin, a binary file, is streamed
+        # after the request. a daemon that hangs or closes the connection without answering gets a failed response,
+        # not None, since the request may have been applied and must not be run again in-process
+        import socket
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(timeout)
+
+        try:
+            with client:
+                try:
+                    client.connect(socket_path)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    return None
+
+                with client.makefile('rwb') as stream:
+                    stream.write((json.dumps(request)+'\n').encode())
+                    stream.flush()
+
+                    if stdin is not None:
+                        try:
+                            for chunk in iter(lambda: stdin.read1(65536), b''):
+                                client.sendall(chunk)
+                            client.shutdown(socket.SHUT_WR)
+                        except (BrokenPipeError, ConnectionResetError):
+                            pass    # the daemon stopped reading, e.g. the command failed, its response says why
+
+                    return json.loads(stream.readline())
+        except (OSError, ValueError) as e:
+            # timeouts, resets, and an empty or partial response line
+            debug("No response from the daemon", e)
+            return { 'output':"The daemon did not respond\n", 'status':1 }
+
+    def forward(args: List[str]):
+        # runs a CLI call in the daemon if one is running, the exit status or None to run it in-process
+        socket_path = WardrobeDaemon.socket_path_for(WARDROBE)
+        if not os.path.exists(socket_path):
+            return None
+
+        # 'import -' streams stdin to the daemon rather than reading all of it first
+        stream_stdin = args[1] == 'import' and args[2:3] == ['-']
+        response = WardrobeDaemon.request(socket_path, { 'argv':args[1:], 'stream_stdin':stream_stdin, 'user':USER }, sys.stdin.buffer if stream_stdin else None)
+        if response is None:
+            return None
+
+        print(response['output'], end='')
+        return response['status']
+
+    def handle_daemon_cli(args: List[str]):
+        debug('handle_daemon_cli({0})'.format(','.join(args)))
+
+        socket_path = WardrobeDaemon.socket_path_for(WARDROBE)
+
+        if args and args[0] in ('stop', 'status'):
+            response = WardrobeDaemon.request(socket_path, { 'control':args[0] })
+            if response is None:
+                print("No daemon is running")
+            else:
+                print(response['output'], end='')
+            return
+
+        if args:
+            print('Daemon Help:\n\t(no option): serve the wardrobe until stopped\n\tstatus\n\tstop')
+            return
+
+        WardrobeDaemon(WardrobeGenerator('fixed.json', WARDROBE, True), socket_path).serve()
+
+
+CATALOGUE_WORKER = None    # per-process generator used by catalogue workers
+
+
+def new_seed() -> int:
+    import random
+    return random.SystemRandom().getrandbits(32)
+
+def derive_seed(seed: int, index: int) -> int:
+    # independent, reproducible sub-seeds for the draws of a batch or the tasks of a catalogue
+    import hashlib
+    return int(hashlib.sha1("{0}:{1}".format(seed, index).encode()).hexdigest()[:8], 16)
+
+def catalogue_worker_init(compiled_fixed: Dict, articles: Dict[str, List[Dict]]):
+    global CATALOGUE_WORKER
+
+    fixed = FixedData.from_compiled(compiled_fixed)
+    CATALOGUE_WORKER = WardrobeGenerator.from_loaded(fixed, Wardrobe(fixed.article_map, dict(articles)))
 
+def catalogue_worker_task(task) -> List[Dict]:
+    criteria, n, seed = task
+
+    outfits = CATALOGUE_WORKER.generate_many(criteria, n, seed=seed)
+
+    # only oid references travel back to the parent, which resolves them against its own wardrobe
+    return [ outfit.dump(CATALOGUE_WORKER.wardrobe.articles_by_oid) for outfit in outfits ]
 
 
 def debug(*msgs):
@@ -637,6 +2954,115 @@ def debug(*msgs):
         print('[DEBUG]',msgs);
 
 
+def startup_phase(phase: str):
+    # only while profiling, long-running processes (the daemon) pass through here on every request
+    if PROFILE_STARTUP:
+        STARTUP_MARKS.append((phase, time.perf_counter()))
+
+def print_startup_profile():
+    # time spent in each phase, from the first line of this file (interpreter startup is not included)
+    print("{0:16}|{1:>10}".format('phase', 'ms'), file=sys.stderr)
+
+    for (previous, started), (phase, ended) in zip(STARTUP_MARKS, STARTUP_MARKS[1:]):
+        print("{0:16}|{1:>10.2f}".format(phase, (ended - started) * 1000), file=sys.stderr)
+
+    print("{0:16}|{1:>10.2f}".format('total', (STARTUP_MARKS[-1][1] - STARTUP_MARKS[0][1]) * 1000), file=sys.stderr)
+
+
+def stats_snapshot() -> Dict:
+    return {
+        'timers': { name:{ 'calls':calls, 'seconds':seconds } for name, (calls, seconds) in sorted(TIMERS.items()) },
+        'counters': dict(sorted(COUNTERS.items()))
+    }
+
+def format_stats() -> str:
+    lines = [ "{0:24}|{1:>8}|{2:>12}|{3:>10}".format('timer', 'calls', 'total ms', 'mean ms') ]
+    for name, (calls, seconds) in sorted(TIMERS.items()):
+        lines.append("{0:24}|{1:>8}|{2:>12.2f}|{3:>10.3f}".format(name, calls, seconds * 1000, seconds * 1000 / calls))
+
+    lines.append("{0:24}|{1:>8}".format('counter', 'total'))
+    for name, total in sorted(COUNTERS.items()):
+        lines.append("{0:24}|{1:>8}".format(name, total))
+
+    return '\n'.join(lines)+'\n'
+
+def reset_stats():
+    TIMERS.clear()
+    COUNTERS.clear()
+
+
+def serializer():
+    # orjson is only imported once a file is read or written, and only used when installed
+    global ORJSON
+    if SERIALIZER == 'json':
+        return StdlibSerializer
+
+    if ORJSON is None:
+        try:
+            import orjson
+            ORJSON = orjson
+        except ImportError:
+            if SERIALIZER == 'orjson':
+                print("orjson is not installed, using the json module")
+            ORJSON = False
+
+    return OrjsonSerializer if ORJSON else StdlibSerializer
+
+def read_json(json_file):
+    # a whole file opened in binary mode. orjson parses straight from a memory map of it,
+    # the json module needs it read into one bytes object
+    parser = serializer()
+
+    if parser == OrjsonSerializer and os.fstat(json_file.fileno()).st_size:
+        import mmap
+        with mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            return parser.loads(view)
+
+    return parser.loads(json_file.read())
+
+
+def storage_for(filepath: str):
+    # the storage backend is picked by the wardrobe file's extension, a directory is a segmented wardrobe
+    extension = os.path.splitext(filepath.rstrip(os.sep))[1]
+
+    if extension in SqliteStorage.extensions:
+        return SqliteStorage(filepath)
+
+    if extension in SegmentedStorage.extensions or os.path.isdir(filepath):
+        return SegmentedStorage(filepath)
+
+    return JsonStorage(filepath)
+
+
+def atomic_write(filepath: str, content: Union[str, bytes]):
+    # write to a temporary file in the same directory and rename it over the target,
+    # so an interrupted write never leaves a truncated file behind
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_filepath = tempfile.mkstemp(dir=directory, prefix=".{0}.".format(os.path.basename(filepath)), suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb' if type(content) == type(b'') else 'w') as tmp:
+            tmp.write(content)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+
+        # mkstemp creates the file owner-only, keep the permissions of the file being replaced
+        os.chmod(tmp_filepath, os.stat(filepath).st_mode & 0o777 if os.path.exists(filepath) else 0o644)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def truncate(filepath: str, size: int):
+    # cuts a file back to the size it had before an append that has to be undone
+    with open(filepath, 'r+b') as appended:
+        appended.truncate(size)
+        appended.flush()
+        os.fsync(appended.fileno())
+
 
 def display_articles(articles: List[Article], msg: str=""):
     if msg:
@@ -723,6 +3149,7 @@ def create_article(fixed_data, article_type=None, article_subtype=None):
     price = int(robust_str_entry('Price ($) > '))
     color = robust_str_entry('Color(s) > ', list(fixed_data['compatibility'].keys()))
 
+    import uuid
     return Article(article_type, article_subtype, descr, colors, temp, price, uuid.uuid4())
 
 def clear_screen():
@@ -731,7 +3158,7 @@ def clear_screen():
 
 def main():
 
-    WG = WardrobeGenerator('fixed.json', 'wardrobe.json')
+    WG = WardrobeGenerator('fixed.json', WARDROBE)
 
     WG.menu()
 
@@ -745,14 +3172,107 @@ def is_cli_transaction( args: List[str] ) -> bool:
 
 def handle_cli_transaction( args: List[str] ):
 
-    WG = WardrobeGenerator('fixed.json','wardrobe.json', True)
+    # modes that do not need the wardrobe are dispatched before anything is loaded
+
+    # validation reports on fixed.json without loading (and possibly fixing) it
+    if args[1] == 'validate':
+        WardrobeGenerator.handle_validate_cli(args[2:])
+        startup_phase('validate')
+        return
+
+    if args[1] == 'help':
+        print('')
+        WardrobeGenerator.help_cli(args[2:])
+        print('')
+        startup_phase('help')
+        return
+
+    if args[1] == 'daemon':
+        WardrobeDaemon.handle_daemon_cli(args[2:])
+        return
+
+    if args[1] == 'convert':
+        WardrobeGenerator.handle_convert_cli(args[2:])
+        startup_phase('convert')
+        return
+
+    if args[1] == 'stats':
+        WardrobeGenerator.handle_stats_cli(args[2:])
+        return
+
+    # a running daemon has everything loaded already
+    if DAEMON:
+        status = WardrobeDaemon.forward(args)
+        if status is not None:
+            startup_phase('daemon')
+            if status:
+                sys.exit(status)
+            return
+
+    if USER is not None:
+        tenancy = WardrobeTenancy(FixedData.load('fixed.json'))
+        startup_phase('fixed data')
+        WG = tenancy.generator_for(USER)
+    elif args[1] == 'list' and args[2:] and args[2:] != ['all'] and type(storage_for(WARDROBE)) == SqliteStorage:
+        # a database answers a listing with an indexed query, only the matching rows are loaded
+        WG = WardrobeGenerator.from_loaded(FixedData.load('fixed.json'), None)
+        startup_phase('fixed data')
+        article_type, article_subtype, description, colors, temp, price = WG.parse_article_cli_args(args[2:])
+        if article_type:
+            WG.wardrobe = Wardrobe(WG.article_map, SqliteStorage(WARDROBE).load(article_type, [article_subtype] if article_subtype else []))
+            startup_phase('wardrobe')
+            WG.handle_cli_transaction(args, commit=False)
+            return
+        WG.open_wardrobe(WARDROBE)
+    else:
+        WG = WardrobeGenerator('fixed.json', WARDROBE, True)
 
     WG.handle_cli_transaction(args)
 
 
 if __name__ == '__main__':
+    if '--profile-startup' in sys.argv:
+        sys.argv.remove('--profile-startup')
+        PROFILE_STARTUP = True
+
+    if '--stats' in sys.argv:
+        sys.argv.remove('--stats')
+        STATS = True
+
+    if '--stats-json' in sys.argv:
+        sys.argv.remove('--stats-json')
+        STATS = True
+        STATS_JSON = True
+
+    if '--no-daemon' in sys.argv:
+        sys.argv.remove('--no-daemon')
+        DAEMON = False
+
+    if '--wardrobe' in sys.argv[:-1]:
+        position = sys.argv.index('--wardrobe')
+        WARDROBE = sys.argv[position + 1]
+        del sys.argv[position:position + 2]
+
+    if '--user' in sys.argv[:-1]:
+        position = sys.argv.index('--user')
+        USER = sys.argv[position + 1]
+        del sys.argv[position:position + 2]
+
+        if not WardrobeTenancy.user_id_pattern.fullmatch(USER):
+            print("Invalid user id '{0}': letters, digits, '_', '-' and '.' only, not starting with '.'".format(USER))
+            sys.exit(2)
+
+    startup_phase('definitions')
+
     if is_cli_transaction(sys.argv):
         handle_cli_transaction(sys.argv)
     else:
         print("Starting Interactive")
         main()
+
+    if PROFILE_STARTUP:
+        print_startup_profile()
+
+    # a call forwarded to the daemon has nothing to report, the daemon collected it
+    if STATS and (TIMERS or COUNTERS):
+        print(json.dumps(stats_snapshot()) if STATS_JSON else format_stats(), end='\n' if STATS_JSON else '', file=sys.stderr)
@@ -0,0 +1,324 @@
+
+import asyncio, contextlib, json, sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import *
+from urllib.parse import parse_qsl, urlsplit
+
+from wardrobe import STATS, WARDROBE, Article, Outfit, WardrobeDaemon, WardrobeGenerator, debug, new_seed, stats_snapshot
+
+GENERATION_WORKERS = 4      # threads generation runs on, so searches never block the event loop
+
+
+class ReadWriteLock():
+
+    # many readers or one writer. a waiting writer keeps new readers out, so writes are not starved
+
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.readers = 0
+        self.writer_active = False
+        self.waiting_writers = 0
+
+    @contextlib.asynccontextmanager
+    async def reading(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writer_active and not self.waiting_writers)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def writing(self):
+        async with self.condition:
+            self.waiting_writers += 1
+            await self.condition.wait_for(lambda: not self.writer_active and not self.readers)
+            self.waiting_writers -= 1
+            self.writer_active = True
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.writer_active = False
+                self.condition.notify_all()
+
+
+class WardrobeAPI():
+
+    # JSON endpoints over one in-memory wardrobe:
+    #   GET    /list?type=&subtype=&color=&weather=
+    #   GET    /generate?weather=&color=&use=&engine=&top=&count=&seed=
+    #   POST   /articles            (article json)
+    #   DELETE /articles/<oid>
+    #   GET    /history?last=N
+    #   GET    /stats               (timers and counters, collected with WARDROBE_STATS=1)
+    # reads are answered on the event loop, mutations go through a single writer task that applies
+    # whatever has queued up and commits it once, generation runs on a thread pool under a read lock
+
+    def __init__(self, generator: WardrobeGenerator, workers: int =GENERATION_WORKERS):
+        self.generator = generator
+        self.wardrobe = generator.wardrobe
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = ReadWriteLock()
+        self.writes = asyncio.Queue()
+        self.writer_task = None
+        self.prepare()
+
+        self.routes = {
+            ('GET', 'list'): self.list_articles,
+            ('GET', 'generate'): self.generate,
+            ('POST', 'articles'): self.add_article,
+            ('DELETE', 'articles'): self.delete_article,
+            ('GET', 'history'): self.history,
+            ('GET', 'stats'): self.stats
+        }
+
+    def prepare(self):
+        # lazily built structures would otherwise be built from several threads at once
+        self.wardrobe.attribute_index()
+        self.wardrobe.outfit_history.load()
+        self.wardrobe.outfit_history.wear_index()
+
+    def reload(self):
+        # back to what is on disk, dropping whatever was applied in memory since the last commit
+        self.generator.open_wardrobe(self.generator.filepath)
+        self.wardrobe = self.generator.wardrobe
+        self.prepare()
+
+    async def dispatch(self, method: str, target: str, body: bytes =b'') -> Tuple[int, Dict]:
+        url = urlsplit(target)
+        segments = [ segment for segment in url.path.split('/') if segment ]
+        route = self.routes.get((method, segments[0] if segments else ''))
+
+        if route is None:
+            return 404, { 'error':"no route for {0} {1}".format(method, url.path) }
+
+        try:
+            return await route(dict(parse_qsl(url.query)), segments[1:], json.loads(body) if body else None)
+        except (KeyError, ValueError, TypeError, IndexError) as e:
+            debug("Rejected request", method, target, e)
+            return 400, { 'error':"invalid request: {0!r}".format(e) }
+        except Exception as e:
+            print("Failed to handle {0} {1}: {2!r}".format(method, target, e))
+            return 500, { 'error':"internal error" }
+
+    async def write(self, mutation: Callable):
+        # queues a mutation for the writer task, resolves once it is applied and committed
+        if self.writer_task is None:
+            self.writer_task = asyncio.ensure_future(self.writer())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((mutation, future))
+        return await future
+
+    async def writer(self):
+        loop = asyncio.get_running_loop()
+        running = True
+
+        while running:
+            batch = [ await self.writes.get() ]
+            while not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+
+            # None is queued by close(), everything queued before it is still written
+            if None in batch:
+                batch = [ write for write in batch if write is not None ]
+                running = False
+
+            outcomes = []
+            async with self.lock.writing():
+                for mutation, future in batch:
+                    try:
+                        outcomes.append((future, mutation(), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+
+            # one commit for the whole batch, callers are answered once it is on disk
+            try:
+                await loop.run_in_executor(self.executor, self.generator.commit)
+            except Exception as e:
+                print("Failed to commit changes: {0!r}".format(e))
+                outcomes = [ (future, None, e) for future, result, error in outcomes ]
+
+                # the storage took back what it had written of the batch (history included), but the batch is still
+                # applied in memory and pending in the journal, a later commit would persist writes that were reported as failed
+                async with self.lock.writing():
+                    try:
+                        await loop.run_in_executor(self.executor, self.reload)
+                    except Exception as reload_error:
+                        print("Failed to reload {0}: {1!r}".format(self.generator.filepath, reload_error))
+
+            for future, result, error in outcomes:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        if self.writer_task is not None:
+            await self.writes.put(None)
+            await self.writer_task
+            self.writer_task = None
+
+        self.executor.shutdown()
+
+    def outfit_json(outfit: Outfit) -> Dict:
+        return {
+            'oid': str(outfit.oid),
+            'seed': outfit.seed,
+            'criteria': outfit.criteria,
+            'articles': { article_type:[ article.jsonify() for article in articles ] for article_type, articles in outfit.articles.items() }
+        }
+
+    async def list_articles(self, query: Dict[str, str], segments: List[str], body) -> Tuple[int, Dict]:
+        if any( key in query for key in ('type', 'subtype', 'color', 'weather') ):
+            articles = self.wardrobe.select(query.get('type', ''),
+                                            [query['subtype']] if 'subtype' in query else [],
+                                            [query['color']] if 'color' in query else [],
+                                            query.get('weather', ''))
+        else:
+            articles = self.wardrobe.articles_for(self.wardrobe.articles_by_oid.keys())
+
+        return 200, { 'articles':[ article.jsonify() for article in articles ] }
+
+    async def generate(self, query: Dict[str, str], segments: List[str], body) -> Tuple[int, Dict]:
+        criteria = dict(query)
+        seed = int(criteria['seed']) if 'seed' in criteria else new_seed()
+        n = int(criteria.get('count', criteria.get('top', 1)))
+
+        for category, palettes in (('color', self.generator.palettes), ('use', self.generator.uses)):
+            if category in criteria and criteria[category] not in palettes:
+                raise ValueError("unknown {0} '{1}'".format(category, criteria[category]))
+
+        async with self.lock.reading():
+            outfits = await asyncio.get_running_loop().run_in_executor(self.executor, self.generator.generate_many, criteria, n, True, seed)
+
+        def record():
+            for outfit in outfits:
+                self.wardrobe.add_outfit(outfit)
+
+        await self.write(record)
+
+        return 200, { 'outfits':[ WardrobeAPI.outfit_json(outfit) for outfit in outfits ] }
+
+    async def add_article(self, query: Dict[str, str], segments: List[str], body) -> Tuple[int, Dict]:
+        if type(body) != type({}) or body.get('article_subtype') not in self.generator.article_map.get(body.get('article_type'), []):
+            raise ValueError("an article needs a known article_type and article_subtype")
+
+        article = Article.from_json(dict(body, oid=None))
+        if article is None:
+            raise ValueError("incomplete article")
+
+        await self.write(lambda: self.wardrobe.add_article(article))
+
+        return 201, { 'article':article.jsonify() }
+
+    async def delete_article(self, query: Dict[str, str], segments: List[str], body) -> Tuple[int, Dict]:
+        oid = segments[0]
+
+        def remove():
+            # looked up when the write is applied, an earlier write in the batch may have removed it
+            article = self.wardrobe.articles_by_oid.get(oid)
+            if article is not None:
+                self.wardrobe.remove_article(article)
+            return article
+
+        article = await self.write(remove)
+
+        if article is None:
+            return 404, { 'error':"no article {0}".format(oid) }
+
+        return 200, { 'article':article.jsonify() }
+
+    async def history(self, query: Dict[str, str], segments: List[str], body) -> Tuple[int, Dict]:
+        outfits = self.wardrobe.outfit_history.last(int(query['last'])) if 'last' in query else list(self.wardrobe.outfit_history)
+
+        return 200, { 'outfits':[ WardrobeAPI.outfit_json(outfit) for outfit in outfits ] }
+
+    async def stats(self, query: Dict[str, str], segments: List[str], body) -> Tuple[int, Dict]:
+        return 200, dict(stats_snapshot(), enabled=STATS)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # minimal HTTP/1.1, one request per connection
+        try:
+            method, target, version = (await reader.readline()).decode().split()
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, value = line.decode().split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, payload = await self.dispatch(method.upper(), target, body)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, { 'error':"malformed request: {0!r}".format(e) }
+
+        data = json.dumps(payload).encode()
+        writer.write("HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\nConnection: close\r\n\r\n"
+                     .format(status, HTTPStatus(status).phrase, len(data)).encode() + data)
+
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str ='127.0.0.1', port: int =8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print("Serving {0} on http://{1}:{2}".format(self.generator.filepath, host, port))
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
+
+
+class LocalClient():
+
+    # calls the API in-process, without sockets, e.g. for tests
+
+    def __init__(self, api: WardrobeAPI):
+        self.api = api
+
+    async def request(self, method: str, target: str, payload=None) -> Tuple[int, Dict]:
+        body = json.dumps(payload).encode() if payload is not None else b''
+        status, response = await self.api.dispatch(method, target, body)
+
+        # responses go through json like they would over the network
+        return status, json.loads(json.dumps(response))
+
+    async def get(self, target: str) -> Tuple[int, Dict]:
+        return await self.request('GET', target)
+
+    async def post(self, target: str, payload) -> Tuple[int, Dict]:
+        return await self.request('POST', target, payload)
+
+    async def delete(self, target: str) -> Tuple[int, Dict]:
+        return await self.request('DELETE', target)
+
+
+if __name__ == '__main__':
+    host, port = '127.0.0.1', 8080
+    if len(sys.argv) > 1:
+        host, port = sys.argv[1].rsplit(':', 1) if ':' in sys.argv[1] else (host, sys.argv[1])
+
+    # the daemon would be writing the same files
+    if WardrobeDaemon.request(WardrobeDaemon.socket_path_for(WARDROBE), { 'control':'status' }) is not None:
+        print("A daemon is serving {0}, stop it first".format(WARDROBE))
+        sys.exit(1)
+
+    api = WardrobeAPI(WardrobeGenerator('fixed.json', WARDROBE, True))
+
+    try:
+        asyncio.run(api.serve(host, int(port)))
+    except KeyboardInterrupt:
+        pass